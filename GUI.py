@@ -1,9 +1,13 @@
 import tkinter as tk
 from tkinter import ttk
 from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from simulation import run_simulation
-from propability_function import compute_propability_of_state
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+from chart import CHART_SERIES, series_key, simulation_chart
+from analytics import analyse
+from result_cache import ResultCache, CACHE_DIR, simulation_key, cached_propability_of_state
+from simulation_worker import SimulationWorker
+
+POLL_INTERVAL = 100  # ms between two checks for messages of the running simulation
 
 ps_processing_time_values = {}
 # Main application window
@@ -54,6 +58,10 @@ tk.Label(general_section.content, text="Tempo przybycia klientów (ARRIVAL_RATE)
 arrival_rate = tk.DoubleVar(value=2.0)
 tk.Entry(general_section.content, textvariable=arrival_rate).pack(fill=tk.X)
 
+tk.Label(general_section.content, text="Ziarno losowe (puste = losowe, wyniki nie są zapisywane):").pack(anchor=tk.W)
+seed = tk.StringVar(value="1")
+tk.Entry(general_section.content, textvariable=seed).pack(fill=tk.X)
+
 # PS_Probabilities Section
 ps_probs_section = CollapsibleSection(params_frame, "PS_Probabilities")
 ps_probs_section.pack(fill=tk.X)
@@ -155,7 +163,8 @@ def parse_string_var_to_list(string_var, value_type=float):
     """Convert a comma-separated string in a StringVar to a list of values."""
     return [value_type(v.strip()) for v in string_var.get().split(',')]
 
-def handle_simulation():
+def collect_scenario():
+    """Keyword arguments of run_simulation from the parameter fields."""
     ps_processing_time_values = {
         key: {
             "phases": list(range(len(parse_string_var_to_list(ps_processing_time_rates[key])))),
@@ -196,30 +205,84 @@ def handle_simulation():
     }
 
     # Collect other parameters
-    num_clients_value = num_clients.get()
-    arrival_rate_value = arrival_rate.get()
+    return {
+        'ps_pt': ps_processing_time_values,
+        'fifo_pt': fifo_processing_time_values,
+        'lifopr_pt': lifopr_processing_time_values,
+        'ps_co': ps_consultants.get(),
+        'fifo_co': fifo_consultants.get(),
+        'lifopr_co': lifopr_consultants.get(),
+        'ps_prob': ps_probabilities_values,
+        'fifo_prob': fifo_probabilities_values,
+        'lifopr_prob': lifopr_probabilities_values,
+        'clients': num_clients.get(),
+        'arrival_rate': arrival_rate.get(),
+        'seed': int(seed.get()) if seed.get().strip() else None
+    }
 
-    try:
-        fifo_results, lifopr_results, ps_results, wait_times, consultant_averages = run_simulation(
-                ps_processing_time_values,
-                fifo_processing_time_values,
-                lifopr_processing_time_values,
-                ps_consultants.get(),
-                fifo_consultants.get(),
-                lifopr_consultants.get(),
-                ps_probabilities_values,
-                fifo_probabilities_values,
-                lifopr_probabilities_values,
-                num_clients_value,
-                arrival_rate_value
-            )
-        update_chart(fifo_results, lifopr_results, ps_results)
-        update_results(fifo_results, lifopr_results, wait_times[0], wait_times[1], consultant_averages)
+worker = None  # SimulationWorker of the running simulation
+result_cache = ResultCache(CACHE_DIR)  # runs with a seed are reused instead of simulated again
 
+def handle_simulation():
+    """Start the simulation in a worker process, the window stays responsive while it runs."""
+    global worker
+    try:
+        scenario = collect_scenario()
     except Exception as e:
-        print(f"Simulation Error: {e}")
-
-tk.Button(params_frame, text="Uruchom symulację", command=handle_simulation).pack(pady=10)
+        simulation_status.set(f"Simulation Error: {e}")
+        return
+
+    key = simulation_key(scenario)
+    cached = result_cache.get(key) if key is not None else None
+    if cached is not None:
+        simulation_status.set("Wyniki z pamięci podręcznej")
+        show_simulation_results(cached)
+        return
+
+    worker = SimulationWorker()
+    worker.start(scenario, cache_directory=result_cache.directory)
+    run_button.config(state=tk.DISABLED)
+    cancel_button.config(state=tk.NORMAL)
+    simulation_status.set("Symulacja uruchomiona...")
+    start_live_chart()
+    root.after(POLL_INTERVAL, poll_simulation)
+
+def poll_simulation():
+    """Handle messages of the worker and keep polling until the run ends."""
+    for message in worker.poll():
+        if message is None:
+            run_button.config(state=tk.NORMAL)
+            cancel_button.config(state=tk.DISABLED)
+            if worker.cancelled:
+                simulation_status.set("Symulacja anulowana")
+            return
+        kind = message[0]
+        if kind == 'progress':
+            _, now, exited_clients, points = message
+            simulation_status.set(f"Czas symulacji: {now:.1f}, obsłużeni klienci: {exited_clients}")
+            extend_live_chart(points)
+        elif kind == 'done':
+            simulation_status.set("Symulacja zakończona")
+            show_simulation_results(message[1])
+        elif kind == 'error':
+            simulation_status.set(f"Simulation Error: {message[1]}")
+    root.after(POLL_INTERVAL, poll_simulation)
+
+def show_simulation_results(result):
+    fifo_results, lifopr_results, ps_results, wait_times, consultant_averages = result
+    update_chart(fifo_results, lifopr_results, ps_results)
+    update_results(fifo_results, lifopr_results, ps_results, wait_times[0], wait_times[1], consultant_averages)
+
+def cancel_simulation():
+    if worker is not None:
+        worker.cancel()
+
+run_button = tk.Button(params_frame, text="Uruchom symulację", command=handle_simulation)
+run_button.pack(pady=10)
+cancel_button = tk.Button(params_frame, text="Anuluj", command=cancel_simulation, state=tk.DISABLED)
+cancel_button.pack()
+simulation_status = tk.StringVar(value="")
+tk.Label(params_frame, textvariable=simulation_status, font=("Arial", 9)).pack(anchor=tk.W)
 
 # Plot Area
 fig_frame = tk.Frame(root)
@@ -231,16 +294,18 @@ ax.set_title("Wyniki symulacji")
 
 canvas = FigureCanvasTkAgg(fig, master=fig_frame)
 canvas_widget = canvas.get_tk_widget()
+NavigationToolbar2Tk(canvas, fig_frame)  # zoom and pan, the chart re-decimates the view
 canvas_widget.pack(fill=tk.BOTH, expand=True)
 
 def extend_data(fifo_data, lifopr_data, ps_data):
+    # columns are recorded in time order, the last entry is the latest
     max_time = max(
-        max(fifo_data.processed_clients_time),
-        max(lifopr_data.processed_clients_time),
-        max(ps_data.processed_clients_time),
-        max(fifo_data.queue_change_time),
-        max(lifopr_data.queue_change_time),
-        max(ps_data.queue_change_time)
+        fifo_data.processed_clients_time[-1],
+        lifopr_data.processed_clients_time[-1],
+        ps_data.processed_clients_time[-1],
+        fifo_data.queue_change_time[-1],
+        lifopr_data.queue_change_time[-1],
+        ps_data.queue_change_time[-1]
     )
 
     def extend_to_max_time(time_list, value_list, max_time):
@@ -259,26 +324,31 @@ def extend_data(fifo_data, lifopr_data, ps_data):
     extend_to_max_time(lifopr_data.processed_clients_time, lifopr_data.processed_clients, max_time)
     extend_to_max_time(ps_data.processed_clients_time, ps_data.processed_clients, max_time)
 
-def update_chart(fifo_data, lifopr_data, ps_data):
-    extend_data(fifo_data, lifopr_data, ps_data)
+chart = simulation_chart(ax, canvas)
+ax.set_xlabel("Simulation Time")
+ax.set_ylabel("Count")
+ax.legend()
 
-    ax.clear()  # Clear the chart
-    # Plot queue size
-    ax.plot(fifo_data.queue_change_time, fifo_data.queue_size, label="FIFO Queue Size", color="red", linestyle="--")
-    ax.plot(lifopr_data.queue_change_time, lifopr_data.queue_size, label="LIFOPR Queue Size", color="green", linestyle="--")
-    # ax.plot(ps_data.queue_change_time, ps_data.queue_size, label="PS Queue Size", color="orange")
+def start_live_chart():
+    """Empty chart filled in by extend_live_chart while the simulation runs."""
+    chart.clear_data()
+    chart.refresh()
 
-    # Plot processed clients
-    ax.plot(fifo_data.processed_clients_time, fifo_data.processed_clients, label="FIFO Processed Clients", color="red")
-    ax.plot(lifopr_data.processed_clients_time, lifopr_data.processed_clients, label="LIFOPR Processed Clients", color="green")
-    ax.plot(ps_data.processed_clients_time, ps_data.processed_clients, label="PS Processed Clients", color="orange")
+def extend_live_chart(points):
+    """Append the samples of a progress message to the chart."""
+    for series in CHART_SERIES:
+        department, x_series, y_series, _ = series
+        chart.extend(series_key(series), points[department][x_series], points[department][y_series])
+    chart.refresh()
 
-    ax.set_title("Wyniki symulacji")
-    ax.set_xlabel("Simulation Time")
-    ax.set_ylabel("Count")
-    ax.legend()
+def update_chart(fifo_data, lifopr_data, ps_data):
+    extend_data(fifo_data, lifopr_data, ps_data)
 
-    canvas.draw()
+    data = {'fifo': fifo_data, 'lifopr': lifopr_data, 'ps': ps_data}
+    for series in CHART_SERIES:
+        department, x_series, y_series, _ = series
+        chart.set_data(series_key(series), getattr(data[department], x_series), getattr(data[department], y_series))
+    chart.refresh()
 
 # Panel wyników
 results_frame = tk.Frame(root)
@@ -287,23 +357,21 @@ results_frame.pack(side=tk.RIGHT, fill=tk.BOTH, padx=10, pady=10)
 tk.Label(results_frame, text="Wyniki Symulacji", font=("Arial", 14)).pack(anchor=tk.N)
 
 
-def calculate_mean_queue(queue_change_time, queue_size):
-    durations = [queue_change_time[i + 1] - queue_change_time[i] for i in range(len(queue_change_time) - 1)]
-    weighted_sum = sum(size * duration for size, duration in zip(queue_size[:-1], durations))
-    total_time = queue_change_time[-1] - queue_change_time[0]
-    return weighted_sum / total_time if total_time > 0 else 0
-
-def update_results(fifo_data, lifopr_data, lifo_wait_times, fifo_wait_times, averages):
+def update_results(fifo_data, lifopr_data, ps_data, lifo_wait_times, fifo_wait_times, averages):
     # Clear previous results
     for widget in results_frame.winfo_children():
         widget.destroy()
 
-    fifo_mean_queue = calculate_mean_queue(fifo_data.queue_change_time, fifo_data.queue_size)
-    lifopr_mean_queue = calculate_mean_queue(lifopr_data.queue_change_time, lifopr_data.queue_size)
+    kpis = analyse({'PS': ps_data, 'FIFO': fifo_data, 'LIFOPR': lifopr_data})
 
     tk.Label(results_frame, text="Wyniki Symulacji", font=("Arial", 14)).pack(anchor=tk.N, pady=5)
-    tk.Label(results_frame, text=f"FIFO Mean Queue: {fifo_mean_queue:.2f}", font=("Arial", 10)).pack(anchor=tk.W)
-    tk.Label(results_frame, text=f"LIFOPR Mean Queue: {lifopr_mean_queue:.2f}", font=("Arial", 10)).pack(anchor=tk.W)
+    for name, department_kpis in kpis.items():
+        tk.Label(results_frame, text=f"{name} Mean Queue: {department_kpis['queue']['mean']:.2f} "
+                                     f"(p95: {department_kpis['queue']['p95']:.0f})", font=("Arial", 10)).pack(anchor=tk.W)
+    for name, department_kpis in kpis.items():
+        if department_kpis['utilisation'] is not None:
+            tk.Label(results_frame, text=f"{name} Utilisation: {department_kpis['utilisation']:.1%}",
+                     font=("Arial", 10)).pack(anchor=tk.W)
     tk.Label(results_frame, text=f"FIFO Mean Wait Time For Clients: {fifo_wait_times:.2f}",
              font=("Arial", 10)).pack(anchor=tk.W)
     tk.Label(results_frame, text=f"LIFOPR Mean Wait Time For Clients: {lifo_wait_times:.2f}", font=("Arial", 10)).pack(anchor=tk.W)
@@ -366,11 +434,13 @@ def compute_probability():
         lifopr_values = [float(x.strip()) for x in lifopr_probability["complicated"].get().split(",")]
 
         # Compute probability
-        probability = compute_propability_of_state(
+        probability = cached_propability_of_state(
             ps_values, ps_values_medium, ps_values_comp,
             fifo_values, lifopr_values,
             service_rates, arrival_rates,
-            state, ps_processing_time_values
+            state, ps_processing_time_values,
+            servers=(ps_consultants.get(), fifo_consultants.get(), lifopr_consultants.get()),
+            cache=result_cache
         )
 
         probability_result.set(f"Prawdopodobieństwo: {probability:.12f}")
@@ -385,5 +455,12 @@ tk.Button(probability_section, text="Oblicz Prawdopodobieństwo", command=comput
 compute_probability()
 
 
+def close_window():
+    """Stop a running simulation together with the window."""
+    cancel_simulation()
+    root.destroy()
+
+root.protocol("WM_DELETE_WINDOW", close_window)
+
 # Run the application
 root.mainloop()
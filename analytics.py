@@ -0,0 +1,124 @@
+"""Vectorised KPIs of recorded department Results.
+
+Queue series are step functions: queue_size[i] holds from queue_change_time[i] until the next
+change, the last value until the end of the horizon. Everything is computed with NumPy on the
+columns of Results, so no Python loop runs over samples.
+"""
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.95)
+
+
+def _durations(times, until=None):
+    """Time every sample of a step series holds, the last one until until (its own time by default)."""
+    times = np.asarray(times, dtype=float)
+    end = times[-1] if until is None else max(until, times[-1])
+    return np.diff(times, append=end)
+
+
+def time_weighted_mean(times, values, until=None):
+    durations = _durations(times, until)
+    total_time = durations.sum()
+    return float(np.dot(np.asarray(values, dtype=float), durations) / total_time) if total_time > 0 else 0.0
+
+
+def _time_weighted_quantiles(values, durations, total_time, quantiles):
+    """First values at which the share of time spent at or below them reaches every quantile."""
+    targets = np.asarray(quantiles) - 1e-12
+    if np.issubdtype(values.dtype, np.integer) and values.min() >= 0:
+        # queue lengths are small counts, time per level replaces sorting the whole series
+        cumulative = np.cumsum(np.bincount(values, weights=durations)) / total_time
+        return np.minimum(np.searchsorted(cumulative, targets), len(cumulative) - 1).astype(float)
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(durations[order]) / total_time
+    positions = np.minimum(np.searchsorted(cumulative, targets), len(order) - 1)
+    return values[order[positions]].astype(float)
+
+
+def time_weighted_summary(times, values, until=None, quantiles=QUANTILES):
+    """Time-weighted mean, variance, std, quantiles and maximum of a step series."""
+    values = np.asarray(values)
+    durations = _durations(times, until)
+    total_time = durations.sum()
+    if total_time <= 0:
+        summary = {'mean': 0.0, 'variance': 0.0, 'std': 0.0, 'max': float(values.max())}
+        summary.update({f'p{round(p * 100)}': float(values[-1]) for p in quantiles})
+        return summary
+
+    weighted = values * durations
+    mean = weighted.sum() / total_time
+    variance = max(np.dot(weighted, values) / total_time - mean * mean, 0.0)
+    summary = {'mean': float(mean), 'variance': float(variance), 'std': float(np.sqrt(variance)),
+               'max': float(values.max())}
+    summary.update({f'p{round(p * 100)}': float(value) for p, value in
+                    zip(quantiles, _time_weighted_quantiles(values, durations, total_time, quantiles))})
+    return summary
+
+
+def throughput_windows(results, window, step=None, until=None):
+    """Clients processed per time unit over sliding windows of the given length.
+
+    Returns (window ends, rates) for windows ending every step time units (window / 10 by default).
+    """
+    times = results.processed_clients_time.view()[1:]  # the first sample is the initial 0
+    end = times[-1] if until is None and len(times) else (until or 0)
+    step = step or window / 10
+    window_ends = np.arange(min(window, end), end + step / 2, step) if end > 0 else np.empty(0)
+    counts = np.searchsorted(times, window_ends, side='right') - np.searchsorted(times, window_ends - window, side='right')
+    return window_ends, counts / window
+
+
+def horizon(*results):
+    """Last recorded time over all given Results."""
+    return float(max(max(result.queue_change_time[-1], result.processed_clients_time[-1]) for result in results))
+
+
+def littles_law(results, until):
+    """Compare the time-weighted number L of clients counted in the queue series with lambda * W.
+
+    PS counts every client in the department, so W is the time in department; FIFO and LIFOPR count
+    waiting clients only, so W is the wait for a consultant (every wait, including the ones after a
+    preemption). lambda is the rate of the corresponding observations. Needs the streaming statistics
+    attached to results by run_simulation, None otherwise.
+    """
+    statistics = results.statistics
+    if statistics is None or until <= 0:
+        return None
+    observations = statistics.time_in_department if results.counts_in_service else statistics.wait
+    clients = time_weighted_mean(results.queue_change_time.view(), results.queue_size.view(), until)
+    rate = observations.count / until
+    predicted = rate * observations.mean
+    return {
+        'L': clients,
+        'lambda': rate,
+        'W': observations.mean,
+        'lambda_W': predicted,
+        'relative_error': abs(clients - predicted) / clients if clients > 0 else abs(predicted)
+    }
+
+
+def department_kpis(results, until=None, window=None, quantiles=QUANTILES):
+    """KPIs of one department, until defaults to its last recorded time."""
+    until = float(horizon(results) if until is None else until)
+    processed = int(results.processed_clients[-1])
+    kpis = {
+        'queue': time_weighted_summary(results.queue_change_time.view(), results.queue_size.view(), until, quantiles),
+        'processed': processed,
+        'throughput': processed / until if until > 0 else 0.0,
+        'utilisation': None,
+        'littles_law': littles_law(results, until)
+    }
+    if results.servers and until > 0:
+        kpis['utilisation'] = float(results.busy_time / (results.servers * until))
+    if window:
+        _, rates = throughput_windows(results, window, until=until)
+        kpis['throughput_window'] = {'window': window,
+                                     'min': float(rates.min()) if len(rates) else 0.0,
+                                     'max': float(rates.max()) if len(rates) else 0.0}
+    return kpis
+
+
+def analyse(departments, until=None, window=None, quantiles=QUANTILES):
+    """KPIs of every department in {name: Results} over a common horizon (the last recorded time)."""
+    until = float(horizon(*departments.values()) if until is None else until)
+    return {name: department_kpis(results, until, window, quantiles) for name, results in departments.items()}
@@ -0,0 +1,221 @@
+"""Arrival streams of new clients, generated in vectorised blocks.
+
+An arrival process yields blocks (arrival times, issue codes or None) of increasing absolute times;
+issue codes of None are drawn by the route. Times come from the 'arrivals' random streams of the run
+(see sampling.RandomStreams), BLOCK_SIZE at a time:
+
+    PoissonArrivals(rate)                       exponential gaps with mean 1 / rate
+    DeterministicArrivals(gap)                  one client every gap time units starting at 0
+    PiecewiseArrivals(breakpoints, rates)       rate rates[i] from breakpoints[i] on (e.g. an intraday
+                                                profile, repeated every period when given), by thinning
+    TraceArrivals(times, classes=None)          replay of recorded arrival times (and issue types)
+
+make_arrivals turns the arrivals argument of run_simulation into a process: 'poisson' and
+'deterministic' use arrival_rate, a dict {'breakpoints', 'rates', 'period'} or {'times', 'classes'}
+describes a schedule or trace (as in scenario files), process objects are returned unchanged.
+feed_clients is the single SimPy process injecting all arrivals into Route._first_arrival.
+Every process tells by horizon(clients) when the given number of clients will have arrived, which
+time_limit turns into the safety limit of a run.
+"""
+import numpy as np
+
+from sampling import BLOCK_SIZE, LARGEST_UNIFORM
+
+SAFETY_FACTOR = 1000  # a run may take SAFETY_FACTOR time units per client, or as many times its arrival horizon
+
+
+def _exponential_block(rng, rate, n, antithetic):
+    uniforms = rng.random(n)
+    if antithetic:
+        uniforms = LARGEST_UNIFORM - uniforms
+    return -np.log1p(-uniforms) / rate
+
+
+class PoissonArrivals:
+    """Homogeneous Poisson process with the given rate (lambda)."""
+    limit = None
+
+    def __init__(self, rate, block_size=BLOCK_SIZE):
+        if rate <= 0:
+            raise ValueError("arrival rate has to be positive")
+        self.rate = rate
+        self.block_size = block_size
+
+    def horizon(self, clients):
+        """Expected time of the last of clients arrivals."""
+        return clients / self.rate
+
+    def blocks(self, context):
+        rng = context.streams.generator('arrivals')
+        antithetic = context.streams.antithetic
+        start = 0.0
+        while True:
+            times = start + np.cumsum(_exponential_block(rng, self.rate, self.block_size, antithetic))
+            start = times[-1]
+            yield times, None
+
+
+class DeterministicArrivals:
+    """A client every gap time units, the first one at time 0."""
+    limit = None
+
+    def __init__(self, gap, block_size=BLOCK_SIZE):
+        if gap <= 0:
+            raise ValueError("gap between arrivals has to be positive")
+        self.gap = gap
+        self.block_size = block_size
+
+    def horizon(self, clients):
+        return max(clients - 1, 0) * self.gap
+
+    def blocks(self, context):
+        first = 0
+        while True:
+            yield (first + np.arange(self.block_size)) * self.gap, None
+            first += self.block_size
+
+
+class PiecewiseArrivals:
+    """Poisson process with a piecewise-constant rate, sampled by thinning.
+
+    The rate is rates[i] on [breakpoints[i], breakpoints[i + 1]) and rates[-1] after the last breakpoint;
+    with period set the profile repeats every period time units. Candidates of a Poisson process with the
+    highest rate are kept with probability rate(t) / highest rate.
+    """
+    limit = None
+
+    def __init__(self, breakpoints, rates, period=None, block_size=BLOCK_SIZE):
+        self.breakpoints = np.asarray(breakpoints, dtype=float)
+        self.rates = np.asarray(rates, dtype=float)
+        if len(self.breakpoints) != len(self.rates) or not len(self.rates):
+            raise ValueError("every rate needs its breakpoint")
+        if self.breakpoints[0] != 0 or np.any(np.diff(self.breakpoints) <= 0):
+            raise ValueError("breakpoints have to start at 0 and increase")
+        if np.any(self.rates < 0) or self.rates.max() <= 0:
+            raise ValueError("rates have to be non-negative and not all zero")
+        if period is not None and period <= self.breakpoints[-1]:
+            raise ValueError("period has to be longer than the last breakpoint")
+        if period is None and self.rates[-1] == 0:
+            raise ValueError("the last rate has to be positive, arrivals would stop for good")
+        self.period = period
+        self.block_size = block_size
+        self.highest_rate = self.rates.max()
+
+    def rate(self, times):
+        """Arrival rate at the given times."""
+        times = np.asarray(times, dtype=float)
+        if self.period is not None:
+            times = np.mod(times, self.period)
+        return self.rates[np.searchsorted(self.breakpoints, times, side='right') - 1]
+
+    def horizon(self, clients):
+        """Time at which the integrated rate reaches clients."""
+        ends = np.append(self.breakpoints[1:], self.period if self.period is not None else np.inf)
+        masses = self.rates * (ends - self.breakpoints)
+        offset = 0.0
+        if self.period is not None:
+            periods, clients = divmod(clients, masses.sum())
+            offset = periods * self.period
+        if clients <= 0:
+            return offset
+        cumulative = np.concatenate(([0.0], np.cumsum(masses)))
+        segment = int(np.searchsorted(cumulative, clients)) - 1
+        return offset + self.breakpoints[segment] + (clients - cumulative[segment]) / self.rates[segment]
+
+    def blocks(self, context):
+        rng = context.streams.generator('arrivals')
+        thinning = context.streams.generator('arrivals/thinning')
+        antithetic = context.streams.antithetic
+        start = 0.0
+        while True:
+            candidates = start + np.cumsum(_exponential_block(rng, self.highest_rate, self.block_size, antithetic))
+            start = candidates[-1]
+            uniforms = thinning.random(self.block_size)
+            if antithetic:
+                uniforms = LARGEST_UNIFORM - uniforms
+            accepted = candidates[uniforms * self.highest_rate < self.rate(candidates)]
+            if len(accepted):
+                yield accepted, None
+
+
+class TraceArrivals:
+    """Replay of recorded arrival times, optionally with the issue type of every arrival."""
+    def __init__(self, times, classes=None):
+        self.times = np.asarray(times, dtype=float)
+        if np.any(np.diff(self.times) < 0) or (len(self.times) and self.times[0] < 0):
+            raise ValueError("trace times have to be non-negative and sorted")
+        if classes is not None and len(classes) != len(self.times):
+            raise ValueError("trace needs one class per arrival")
+        self.classes = classes
+        self.limit = len(self.times)
+
+    def horizon(self, clients):
+        clients = min(clients, self.limit)
+        return self.times[clients - 1] if clients else 0.0
+
+    def blocks(self, context):
+        codes = None
+        if self.classes is not None:
+            class_codes = {name: code for code, name in enumerate(context.classes)}
+            try:
+                codes = [class_codes[name] for name in self.classes]
+            except KeyError as e:
+                raise ValueError(f"trace uses unknown class {e.args[0]!r}") from None
+        yield self.times, codes
+
+
+def make_arrivals(arrivals, arrival_rate):
+    """Arrival process for the arrivals argument of run_simulation."""
+    if arrivals == 'poisson':
+        return PoissonArrivals(arrival_rate)
+    if arrivals == 'deterministic':
+        return DeterministicArrivals(1 / arrival_rate)
+    if isinstance(arrivals, dict):
+        if 'times' in arrivals:
+            return TraceArrivals(arrivals['times'], arrivals.get('classes'))
+        return PiecewiseArrivals(arrivals['breakpoints'], arrivals['rates'], arrivals.get('period'))
+    if isinstance(arrivals, str):
+        raise ValueError(f"unknown arrivals {arrivals!r}, use 'poisson', 'deterministic', a schedule or a trace")
+    return arrivals
+
+
+def expected_arrivals(process, clients):
+    """Number of clients a run will generate, None when unbounded."""
+    if process.limit is None:
+        return clients
+    return process.limit if clients is None else min(clients, process.limit)
+
+
+def time_limit(process, clients):
+    """Safety limit on the simulated time of a run of clients arriving from the process.
+
+    clients * SAFETY_FACTOR time units, or SAFETY_FACTOR times the horizon of the arrivals when that is
+    longer, so slow arrival streams are not cut off. Processes without horizon only get the first.
+    """
+    horizon = process.horizon(clients) if hasattr(process, 'horizon') else 0
+    return max(clients * SAFETY_FACTOR, SAFETY_FACTOR * horizon)
+
+
+def admit_client(route, client_id, now, issue_code=None):
+    """Create a new client and send it to its first department."""
+    if issue_code is None:
+        issue_code = route._arrival_class()
+    client = route.context.client_pool.acquire(client_id, issue_code, now)
+    client._record_issue(issue_code)
+    if route.log_arrivals:
+        route.log.write("Client %s arrives with a %s issue at time %.2f.", client_id, route.context.classes[issue_code], now)
+    route._first_arrival(client)
+
+
+def feed_clients(env, process, clients, route):
+    """SimPy process admitting every arrival of the process, without limit when clients is None."""
+    clients = expected_arrivals(process, clients)
+    route.context._expect_clients(clients)
+    client_id = 0
+    for times, codes in process.blocks(route.context):
+        for index, time in enumerate(times.tolist()):
+            if client_id == clients:
+                return
+            yield env.timeout(time - env.now)
+            client_id += 1
+            admit_client(route, client_id, env.now, None if codes is None else codes[index])
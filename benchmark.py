@@ -0,0 +1,359 @@
+"""Throughput benchmarks of run_simulation and the analytical solver.
+
+    python benchmark.py run [--quick] [--repeat 3] [--label NAME] [--history FILE]
+    python benchmark.py compare [BASE] [NEW] [--threshold 0.1] [--history FILE]
+    python benchmark.py check [--seeds 100] [--clients 500]
+
+Every simulation case runs in a fresh process with logging off and a fixed seed, so wall time and
+peak RSS are not influenced by earlier cases. Each case is repeated and the fastest repetition is
+kept. Runs are appended to a JSON history file; compare looks up two of them (by label or index,
+the last two by default) and flags cases that got slower. check runs the same networks and
+run_simulation on both engines and flags metrics whose means differ.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+import simpy as sp
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+HISTORY_FILE = 'benchmark_history.json'
+SEED = 12345
+
+CLIENTS = (1000, 10000)
+CONSULTANT_SCALES = (1, 2)  # multiplies PS/FIFO/LIFOPR consultant counts
+LOAD_LEVELS = (0.5, 1.0)  # multiplies the arrival rate
+QUICK_CLIENTS = (1000,)
+ENGINE_CASES = {'simpy': 'simulation', 'fast': 'simulation-fast'}  # engine: case name prefix
+
+SOLVER_CALLS = 2000
+SWEEP_POINTS = 100000
+
+EQUIVALENCE_SEEDS = 100
+EQUIVALENCE_CLIENTS = 500
+EQUIVALENCE_THRESHOLD = 4  # paired t statistic treated as a mismatch
+
+
+class CountingEnvironment(sp.Environment):
+    """SimPy environment counting processed events."""
+    def __init__(self):
+        super().__init__()
+        self.processed_events = 0
+
+    def step(self):
+        self.processed_events += 1
+        super().step()
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # bytes on macOS, kilobytes elsewhere
+
+
+def _simulation_case(clients, consultant_scale, load, engine='simpy'):
+    """Run one simulation case, executed in a separate process."""
+    from simulation import run_simulation, DEFAULT_SCENARIO, LIFOPR_PREEMPTIVE
+
+    scenario = dict(DEFAULT_SCENARIO)
+    scenario['clients'] = clients
+    scenario['arrival_rate'] = DEFAULT_SCENARIO['arrival_rate'] * load
+    for key in ('ps_co', 'fifo_co', 'lifopr_co'):
+        scenario[key] = DEFAULT_SCENARIO[key] * consultant_scale
+
+    blocks_before = sys.getallocatedblocks()
+    if engine == 'fast':
+        from arrivals import make_arrivals
+        from fast_engine import run_fast
+        from network_spec import three_department_spec
+        from stopping import make_rule
+
+        spec = three_department_spec(scenario['ps_pt'], scenario['fifo_pt'], scenario['lifopr_pt'], scenario['ps_co'],
+                                     scenario['fifo_co'], scenario['lifopr_co'], scenario['ps_prob'], scenario['fifo_prob'],
+                                     scenario['lifopr_prob'], LIFOPR_PREEMPTIVE)
+        start = time.perf_counter()
+        arrivals = make_arrivals(scenario['arrivals'], scenario['arrival_rate'])
+        _, _, env = run_fast(spec, clients, arrivals, make_rule('drain'), seed=SEED)
+    else:
+        env = CountingEnvironment()
+        start = time.perf_counter()
+        run_simulation(**scenario, seed=SEED, log_levels=None, env=env)
+    wall_time = time.perf_counter() - start
+    events = env.processed_events
+
+    return {
+        'wall_time': wall_time,
+        'events': events,
+        'events_per_second': events / wall_time if wall_time > 0 else None,
+        'peak_rss_kb': _peak_rss_kb(),
+        # Python has no cheap allocation counter, memory blocks still alive after the run are reported instead
+        'retained_blocks_per_event': (sys.getallocatedblocks() - blocks_before) / events if events else None,
+    }
+
+
+def _solver_case():
+    """Time cold and cached compute_propability_of_state calls and a broadcast sweep."""
+    from propability_function import compute_propability_of_state, sweep_product_form, _solve_traffic_equations
+    from simulation import PS_PROCESSING_TIME, PS_PROPABILITIES, FIFO_PROPABILITIES, LIFOPR_PROPABILITIES
+
+    parameters = (PS_PROPABILITIES['normal'], PS_PROPABILITIES['medium'], PS_PROPABILITIES['complicated'],
+                  FIFO_PROPABILITIES['medium'], LIFOPR_PROPABILITIES['complicated'], [0.05, 0.0227])
+    states = [(n % 7, n % 5, n % 3) for n in range(SOLVER_CALLS)]
+
+    start = time.perf_counter()
+    for n, state in enumerate(states):
+        _solve_traffic_equations.cache_clear()
+        compute_propability_of_state(*parameters, [0.5 + n * 1e-4], state, PS_PROCESSING_TIME)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for state in states:
+        compute_propability_of_state(*parameters, [0.5], state, PS_PROCESSING_TIME)
+    cached = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sweep_product_form(*parameters, [np.linspace(0.1, 2, SWEEP_POINTS)], PS_PROCESSING_TIME, servers=(5, 5, 3))
+    sweep = time.perf_counter() - start
+
+    return {
+        'wall_time': cold + cached + sweep,
+        'cold_calls_per_second': SOLVER_CALLS / cold,
+        'cached_calls_per_second': SOLVER_CALLS / cached,
+        'sweep_points_per_second': SWEEP_POINTS / sweep,
+        'peak_rss_kb': _peak_rss_kb(),
+    }
+
+
+def _in_fresh_process(function, *args, repeat=1):
+    """Run the case repeat times, every time in a new process, and keep the fastest run."""
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            runs.append(pool.submit(function, *args).result())
+    return min(runs, key=lambda metrics: metrics['wall_time'])
+
+
+def run_benchmarks(quick=False, repeat=3):
+    """Run every case of the matrix, returns {case name: metrics}."""
+    cases = {}
+    for clients in (QUICK_CLIENTS if quick else CLIENTS):
+        for consultant_scale in CONSULTANT_SCALES:
+            for load in LOAD_LEVELS:
+                for engine, prefix in ENGINE_CASES.items():
+                    name = f'{prefix}/clients={clients}/consultants=x{consultant_scale}/load=x{load}'
+                    cases[name] = _in_fresh_process(_simulation_case, clients, consultant_scale, load, engine, repeat=repeat)
+                    print(f"{name}: {cases[name]['wall_time']:.3f} s, {cases[name]['events_per_second']:.0f} events/s")
+    cases['solver'] = _in_fresh_process(_solver_case, repeat=repeat)
+    print(f"solver: {cases['solver']['cold_calls_per_second']:.0f} cold calls/s, "
+          f"{cases['solver']['sweep_points_per_second']:.0f} sweep points/s")
+    return cases
+
+
+def _classic_spec():
+    from network_spec import three_department_spec
+    from simulation import DEFAULT_SCENARIO, LIFOPR_PREEMPTIVE
+
+    scenario = DEFAULT_SCENARIO
+    return three_department_spec(scenario['ps_pt'], scenario['fifo_pt'], scenario['lifopr_pt'], scenario['ps_co'],
+                                 scenario['fifo_co'], scenario['lifopr_co'], scenario['ps_prob'], scenario['fifo_prob'],
+                                 scenario['lifopr_prob'], LIFOPR_PREEMPTIVE), scenario['arrival_rate']
+
+
+def _reentrant_lifopr_spec():
+    """One preemptive LIFOPR consultant, every client comes back once with a higher priority."""
+    from network_spec import StationSpec, NetworkSpec
+
+    spec = NetworkSpec((StationSpec('lifopr', 'lifopr', 1, {'first': 1.0, 'second': 2.0}, True),), ('first', 'second'),
+                       {'first': {'weight': 1, 'station': 'lifopr', 'priority': 0}},
+                       [{'from': ('lifopr', 'first'), 'to': ('lifopr', 'second'), 'p': 1, 'priority': 1},
+                        {'from': ('lifopr', 'second'), 'to': None, 'p': 1}])
+    return spec, 0.6
+
+
+def _network_metrics(results):
+    """Processed clients, time-weighted mean queue size and end time of every station."""
+    metrics = {}
+    for name, station in results.items():
+        arrays = station.as_arrays()
+        times, sizes = arrays['queue_change_time'], arrays['queue_size']
+        span = times[-1] - times[0] if len(times) > 1 else 0
+        metrics[f'{name}_processed'] = len(arrays['processed_clients'])
+        metrics[f'{name}_queue'] = float(sizes[:-1] @ np.diff(times)) / span if span > 0 else 0.0
+        metrics[f'{name}_end'] = arrays['processed_clients_time'][-1] if len(arrays['processed_clients_time']) else 0.0
+    return metrics
+
+
+def _spec_case(make_spec):
+    """Metrics of run_network on the spec of make_spec, MatrixRoute on both engines."""
+    def run_case(engine, clients, seed):
+        from simulation import run_network
+
+        spec, arrival_rate = make_spec()
+        return _network_metrics(run_network(spec, clients, arrival_rate, log_levels=None, seed=seed, engine=engine))
+    return run_case
+
+
+def _scenario_case(engine, clients, seed):
+    """Metrics of run_simulation on DEFAULT_SCENARIO, the Route of network.py on the SimPy engine."""
+    from simulation import run_simulation, DEFAULT_SCENARIO
+
+    fifo, lifopr, ps, wait_times, consultant_times = run_simulation(**dict(DEFAULT_SCENARIO, clients=clients),
+                                                                    log_levels=None, seed=seed, engine=engine)
+    metrics = _network_metrics({'ps': ps, 'fifo': fifo, 'lifopr': lifopr})
+    metrics['lifopr_wait'], metrics['fifo_wait'] = wait_times
+    for department, times in consultant_times.items():
+        metrics[f'{department}_call_time'] = times['avg_call_time']
+        metrics[f'{department}_break_time'] = times['avg_break_time']
+    return metrics
+
+
+# Case name: function (engine, clients, seed) -> {metric: value}
+EQUIVALENCE_CASES = {
+    'classic': _spec_case(_classic_spec),
+    'reentrant-lifopr': _spec_case(_reentrant_lifopr_spec),
+    'run_simulation': _scenario_case,
+}
+
+
+def check_engines(seeds=EQUIVALENCE_SEEDS, clients=EQUIVALENCE_CLIENTS, threshold=EQUIVALENCE_THRESHOLD):
+    """Run every equivalence case on both engines with the same seeds.
+
+    Returns (case, metric, simpy mean, fast mean, t statistic of the paired differences, mismatch) rows.
+    """
+    rows = []
+    for case, run_case in EQUIVALENCE_CASES.items():
+        runs = {engine: [run_case(engine, clients, seed) for seed in range(seeds)] for engine in ENGINE_CASES}
+        for metric in runs['simpy'][0]:
+            simpy_values = np.array([run[metric] for run in runs['simpy']], dtype=float)
+            fast_values = np.array([run[metric] for run in runs['fast']], dtype=float)
+            differences = fast_values - simpy_values
+            spread = differences.std(ddof=1) / np.sqrt(seeds)
+            statistic = abs(differences.mean()) / spread if spread > 0 else (0.0 if not differences.any() else np.inf)
+            rows.append((case, metric, simpy_values.mean(), fast_values.mean(), statistic, statistic > threshold))
+    return rows
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as history_file:
+        return json.load(history_file)
+
+
+def save_run(cases, label=None, path=HISTORY_FILE):
+    history = load_history(path)
+    history.append({
+        'label': label or f'run-{len(history)}',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'cases': cases
+    })
+    with open(path, 'w') as history_file:
+        json.dump(history, history_file, indent=2)
+    return history[-1]
+
+
+def _find_run(history, key):
+    for run in history:
+        if run['label'] == key:
+            return run
+    return history[int(key)]
+
+
+# Metric name: True when higher is better
+COMPARED_METRICS = {
+    'wall_time': False,
+    'events_per_second': True,
+    'peak_rss_kb': False,
+    'cold_calls_per_second': True,
+    'cached_calls_per_second': True,
+    'sweep_points_per_second': True,
+}
+
+
+def compare_runs(base, new, threshold=0.1):
+    """List (case, metric, base value, new value, relative change, regression) for cases of both runs."""
+    rows = []
+    for case, new_metrics in new['cases'].items():
+        base_metrics = base['cases'].get(case)
+        if base_metrics is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old_value, new_value = base_metrics.get(metric), new_metrics.get(metric)
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value
+            regression = change < -threshold if higher_is_better else change > threshold
+            rows.append((case, metric, old_value, new_value, change, regression))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the call center simulation.")
+    parser.add_argument('--history', default=HISTORY_FILE, help="JSON file keeping benchmark runs")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the benchmark matrix and store the results")
+    run_parser.add_argument('--label', help="name of the run in the history file")
+    run_parser.add_argument('--quick', action='store_true', help="only the smallest client count")
+    run_parser.add_argument('--repeat', type=int, default=3, help="repetitions of every case, the fastest is kept")
+
+    compare_parser = commands.add_parser('compare', help="compare two stored runs")
+    compare_parser.add_argument('base', nargs='?', default='-2', help="label or index of the base run")
+    compare_parser.add_argument('new', nargs='?', default='-1', help="label or index of the new run")
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help="relative change treated as regression")
+
+    check_parser = commands.add_parser('check', help="compare both simulation engines on the same seeds")
+    check_parser.add_argument('--seeds', type=int, default=EQUIVALENCE_SEEDS, help="runs per engine and network")
+    check_parser.add_argument('--clients', type=int, default=EQUIVALENCE_CLIENTS, help="clients of every run")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        run = save_run(run_benchmarks(args.quick, args.repeat), args.label, args.history)
+        print(f"Saved as {run['label']} in {args.history}")
+        return 0
+
+    if args.command == 'check':
+        rows = check_engines(args.seeds, args.clients)
+        for case, metric, simpy_mean, fast_mean, statistic, mismatch in rows:
+            flag = "MISMATCH" if mismatch else ""
+            print(f"{case:20} {metric:20} {simpy_mean:14.4g} {fast_mean:14.4g} t={statistic:6.2f} {flag}")
+        mismatches = sum(row[-1] for row in rows)
+        print(f"simpy vs fast: {mismatches} mismatch(es)")
+        return 1 if mismatches else 0
+
+    history = load_history(args.history)
+    base, new = _find_run(history, args.base), _find_run(history, args.new)
+    rows = compare_runs(base, new, args.threshold)
+    for case, metric, old_value, new_value, change, regression in rows:
+        flag = "REGRESSION" if regression else ""
+        print(f"{case:55} {metric:25} {old_value:14.4g} -> {new_value:14.4g} {change:+8.1%} {flag}")
+    regressions = sum(row[-1] for row in rows)
+    print(f"{base['label']} -> {new['label']}: {regressions} regression(s)")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
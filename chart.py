@@ -0,0 +1,164 @@
+"""Rendering of long step series on a matplotlib axes.
+
+Lines never get more points than the axes is wide in pixels: the visible part of every series is
+split into one bucket per pixel column and each bucket is reduced to its first, minimum, maximum
+and last sample (M4 decimation), which draws the same picture as the full series. Zooming or
+panning re-decimates the new view. Lines are animated and updated with blitting, the rest of the
+figure is only redrawn when the axis limits change.
+"""
+import numpy as np
+from network import Column
+
+# Series of the simulation chart: (department, series of the x values, series of the y values, plot keyword arguments)
+CHART_SERIES = (
+    ('fifo', 'queue_change_time', 'queue_size', dict(label="FIFO Queue Size", color="red", linestyle="--")),
+    ('lifopr', 'queue_change_time', 'queue_size', dict(label="LIFOPR Queue Size", color="green", linestyle="--")),
+    ('fifo', 'processed_clients_time', 'processed_clients', dict(label="FIFO Processed Clients", color="red")),
+    ('lifopr', 'processed_clients_time', 'processed_clients', dict(label="LIFOPR Processed Clients", color="green")),
+    ('ps', 'processed_clients_time', 'processed_clients', dict(label="PS Processed Clients", color="orange"))
+)
+
+
+def decimate(x, y, buckets, x_min=None, x_max=None):
+    """First, min, max and last point of every bucket of the series between x_min and x_max.
+
+    x has to be sorted. One sample on each side of the range is kept so lines leave the view
+    correctly. Series with at most 4 * buckets points are returned unchanged.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    start = 0 if x_min is None else max(np.searchsorted(x, x_min, side='right') - 1, 0)
+    stop = len(x) if x_max is None else min(np.searchsorted(x, x_max, side='left') + 1, len(x))
+    x, y = x[start:stop], y[start:stop]
+    buckets = max(int(buckets), 1)
+    if len(x) <= 4 * buckets:
+        return x, y
+
+    edges = np.linspace(x[0], x[-1], buckets + 1)
+    starts = np.unique(np.searchsorted(x, edges[:-1], side='left'))
+    ends = np.append(starts[1:], len(x))
+    minima = np.minimum.reduceat(y, starts)
+    maxima = np.maximum.reduceat(y, starts)
+
+    # within a bucket the extremes are drawn as a vertical segment at the first sample
+    points_x = np.column_stack((x[starts], x[starts], x[starts], x[ends - 1])).ravel()
+    points_y = np.column_stack((y[starts], minima, maxima, y[ends - 1])).ravel()
+    return points_x, points_y
+
+
+def series_key(series):
+    """Key of a CHART_SERIES entry in DecimatedChart.series, its plot keyword arguments are not hashable."""
+    return series[:3]
+
+
+class DecimatedChart:
+    """Step series drawn on ax with per-pixel decimation and blitted updates.
+
+    Series are added with add_series(key, style) and filled with set_data or extend. After changing
+    data call refresh(): when all data still fits into the current view only the lines are blitted,
+    otherwise the view is rescaled and the figure redrawn.
+    """
+    def __init__(self, ax, canvas):
+        self.ax = ax
+        self.canvas = canvas
+        self.series = {}  # {key: (line, x Column, y Column)}
+        self.background = None
+        self.autoscale = True  # follow the data until the user zooms or pans
+        self._setting_limits = False
+        canvas.mpl_connect('draw_event', self._on_draw)
+        ax.callbacks.connect('xlim_changed', self._on_xlim_changed)
+
+    def add_series(self, key, **style):
+        style.setdefault('drawstyle', 'steps-post')
+        line, = self.ax.plot([], [], animated=True, **style)
+        self.series[key] = (line, Column(np.float64), Column(np.float64))
+        return line
+
+    def clear_data(self):
+        """Forget the data of every series and follow new data again."""
+        for line, x_values, y_values in self.series.values():
+            x_values.clear()
+            y_values.clear()
+            line.set_data([], [])
+        self.autoscale = True
+
+    def set_data(self, key, x, y):
+        _, x_values, y_values = self.series[key]
+        x_values.clear()
+        y_values.clear()
+        self.extend(key, x, y)
+
+    def extend(self, key, x, y):
+        _, x_values, y_values = self.series[key]
+        x_values.extend(x)
+        y_values.extend(y)
+
+    def _buckets(self):
+        return max(int(self.ax.bbox.width), 1)
+
+    def _decimate_lines(self):
+        x_min, x_max = self.ax.get_xlim()
+        buckets = self._buckets()
+        for line, x_values, y_values in self.series.values():
+            line.set_data(*decimate(x_values.view(), y_values.view(), buckets, x_min, x_max))
+
+    def _data_limits(self):
+        limits = [(x_values[0], x_values[-1], y_values.view().min(), y_values.view().max())
+                  for _, x_values, y_values in self.series.values() if len(x_values)]
+        if not limits:
+            return None
+        x_min, x_max, y_min, y_max = zip(*limits)
+        return min(x_min), max(x_max), min(y_min), max(y_max)
+
+    def _fits_view(self, limits):
+        x_low, x_high = self.ax.get_xlim()
+        y_low, y_high = self.ax.get_ylim()
+        return x_low <= limits[0] and limits[1] <= x_high and y_low <= limits[2] and limits[3] <= y_high
+
+    def refresh(self):
+        """Show the current data, blitting the lines when the view does not have to change."""
+        limits = self._data_limits() if self.autoscale else None
+        if limits is not None and not self._fits_view(limits):
+            self._set_view(limits)
+            self.canvas.draw_idle()
+            return
+        self._decimate_lines()
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_lines()
+        self.canvas.blit(self.ax.bbox)
+
+    def _set_view(self, limits):
+        x_min, x_max, y_min, y_max = limits
+        x_margin = 0.05 * (x_max - x_min) or 1
+        y_margin = 0.05 * (y_max - y_min) or 1
+        self._setting_limits = True
+        try:
+            # headroom so a growing series does not need a full redraw at every refresh
+            self.ax.set_xlim(x_min, x_max + 4 * x_margin)
+            self.ax.set_ylim(y_min - y_margin, y_max + 4 * y_margin)
+        finally:
+            self._setting_limits = False
+
+    def _draw_lines(self):
+        for line, _, _ in self.series.values():
+            self.ax.draw_artist(line)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_lines()
+
+    def _on_xlim_changed(self, ax):
+        if not self._setting_limits:
+            self.autoscale = False  # zoomed or panned by the user
+        self._decimate_lines()
+
+
+def simulation_chart(ax, canvas, chart_series=CHART_SERIES):
+    """DecimatedChart with a line for every entry of chart_series, keyed by series_key."""
+    chart = DecimatedChart(ax, canvas)
+    for series in chart_series:
+        chart.add_series(series_key(series), **series[3])
+    return chart
@@ -0,0 +1,217 @@
+"""Run scenarios from JSON or TOML files without the GUI.
+
+    python cli.py run scenarios.toml [more files] [--replications 10] [--seed 1] [--processes N]
+                  [--out results] [--format csv|npz|parquet]
+
+A scenario uses the names of the constants at the top of simulation.py, values not given keep
+their defaults from there:
+
+    [[scenarios]]
+    name = "more fifo consultants"
+    FIFO_CONSULTANTS = 8
+    ARRIVAL_RATE = 1.5
+    FIFO_PROPABILITIES = { medium = [0.3, 0.3, 0.4] }
+
+A file holds either one scenario, a list of them or a table with 'scenarios' and optional
+'defaults' shared by all of them. Besides the constants a scenario may set name, seed and
+replications. Every replication of every scenario is one task of a process pool. The output is
+two column tables: <out>_runs with one row per replication and <out>_summary with mean, std and
+confidence half-width of every metric per scenario.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+
+from analytics import analyse
+from replication import run_tasks, summarize_run, summarize_replications, DEPARTMENTS
+from simulation import DEFAULT_SCENARIO, LIFOPR_PREEMPTIVE, STOP_RULE, ENGINE
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # parquet output is optional
+    pyarrow = None
+
+# Scenario file key: keyword argument of run_simulation
+SCENARIO_KEYS = {
+    'PS_PROCESSING_TIME': 'ps_pt',
+    'FIFO_PROCESSING_TIME': 'fifo_pt',
+    'LIFOPR_PROCESSING_TIME': 'lifopr_pt',
+    'PS_CONSULTANTS': 'ps_co',
+    'FIFO_CONSULTANTS': 'fifo_co',
+    'LIFOPR_CONSULTANTS': 'lifopr_co',
+    'PS_PROPABILITIES': 'ps_prob',
+    'FIFO_PROPABILITIES': 'fifo_prob',
+    'LIFOPR_PROPABILITIES': 'lifopr_prob',
+    'NUM_CLIENTS': 'clients',
+    'ARRIVAL_RATE': 'arrival_rate',
+    'ARRIVALS': 'arrivals',
+    'LIFOPR_PREEMPTIVE': 'lifopr_preemptive',
+    'STOP_RULE': 'stop',
+    'ENGINE': 'engine'
+}
+SCENARIO_DEFAULTS = dict(DEFAULT_SCENARIO, lifopr_preemptive=LIFOPR_PREEMPTIVE, stop=STOP_RULE, engine=ENGINE)
+FORMATS = ('csv', 'npz', 'parquet')
+
+
+def load_scenarios(path):
+    """List of (name, run_simulation keyword arguments, seed, replications) defined in a file."""
+    with open(path, 'rb') as scenario_file:
+        if path.endswith('.toml'):
+            data = _toml_module().load(scenario_file)
+        else:
+            data = json.load(scenario_file)
+
+    defaults = {}
+    if isinstance(data, dict) and 'scenarios' in data:
+        defaults = data.get('defaults', {})
+        data = data['scenarios']
+    if isinstance(data, dict):
+        data = [data]
+
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    return [_parse_scenario(dict(defaults, **entry), f'{base_name}-{index}') for index, entry in enumerate(data)]
+
+
+def _toml_module():
+    """tomllib (Python 3.11+) or its backport tomli, imported only when a TOML file is read."""
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise RuntimeError("TOML scenario files need Python 3.11 or the tomli package, use a JSON file instead") from None
+    return tomllib
+
+
+def _parse_scenario(entry, default_name):
+    name = entry.pop('name', default_name)
+    seed = entry.pop('seed', None)
+    replications = entry.pop('replications', None)
+    scenario = dict(SCENARIO_DEFAULTS)
+    for key, value in entry.items():
+        argument = SCENARIO_KEYS.get(key, key)
+        if argument not in SCENARIO_DEFAULTS:
+            raise ValueError(f"scenario {name!r}: unknown parameter {key!r}")
+        scenario[argument] = value
+    return name, scenario, seed, replications
+
+
+def _tasks(scenarios, replications, seed):
+    """One (scenario name, replication, keyword arguments, seed) task per replication."""
+    tasks = []
+    for index, (name, scenario, scenario_seed, scenario_replications) in enumerate(scenarios):
+        # without an explicit seed every scenario gets its own child of the global seed
+        root = np.random.SeedSequence(scenario_seed) if scenario_seed is not None else np.random.SeedSequence(seed, spawn_key=(index,))
+        for replication, child in enumerate(root.spawn(scenario_replications or replications)):
+            tasks.append((name, replication, scenario, child))
+    return tasks
+
+
+def run_metrics(result):
+    """summarize_run plus queue percentile, utilisation and throughput of every department and the end time."""
+    metrics = summarize_run(result)
+    fifo_results, lifopr_results, ps_results = result[:3]
+    kpis = analyse({'ps': ps_results, 'fifo': fifo_results, 'lifopr': lifopr_results})
+    for department in DEPARTMENTS:
+        metrics[f'{department}_queue_p95'] = kpis[department]['queue']['p95']
+        metrics[f'{department}_utilisation'] = kpis[department]['utilisation']
+        metrics[f'{department}_throughput'] = kpis[department]['throughput']
+    metrics['end_time'] = max(results.queue_change_time[-1] for results in result[:3])
+    return metrics
+
+
+def run_scenario_tasks(tasks, processes=None):
+    """(scenario name, replication, metrics) of the tasks in task order, processes=1 runs them in this process."""
+    runs = run_tasks([(scenario, seed) for _, _, scenario, seed in tasks], processes, metrics=run_metrics)
+    return [(name, replication, metrics) for (name, replication, _, _), metrics in zip(tasks, runs)]
+
+
+def runs_table(results):
+    """Column table {column: array} with one row per replication."""
+    metrics = list(results[0][2])
+    table = {
+        'scenario': np.array([name for name, _, _ in results]),
+        'replication': np.array([replication for _, replication, _ in results])
+    }
+    for metric in metrics:
+        table[metric] = np.array([row[metric] if row[metric] is not None else np.nan for _, _, row in results], dtype=float)
+    return table
+
+
+def summary_table(results, confidence=0.95):
+    """Column table with mean, std and half-width of every metric per scenario."""
+    by_scenario = {}
+    for name, _, metrics in results:
+        by_scenario.setdefault(name, []).append({metric: np.nan if value is None else value for metric, value in metrics.items()})
+
+    rows = []
+    for name, runs in by_scenario.items():
+        summary = summarize_replications(runs, confidence)
+        row = {'scenario': name, 'replications': len(runs)}
+        for metric, values in summary.items():
+            row[f'{metric}_mean'] = values['mean']
+            row[f'{metric}_std'] = values['std']
+            row[f'{metric}_half_width'] = values['half_width']
+        rows.append(row)
+    return {column: np.array([row[column] for row in rows]) for column in rows[0]}
+
+
+def write_table(table, path, file_format):
+    """Write a column table, returns the file name."""
+    if file_format == 'npz':
+        np.savez_compressed(f'{path}.npz', **table)
+        return f'{path}.npz'
+    if file_format == 'parquet':
+        if pyarrow is None:
+            raise RuntimeError("parquet output needs pyarrow, use --format csv or npz")
+        pyarrow.parquet.write_table(pyarrow.table({column: values for column, values in table.items()}), f'{path}.parquet')
+        return f'{path}.parquet'
+
+    columns = list(table)
+    with open(f'{path}.csv', 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        writer.writerows(zip(*(table[column].tolist() for column in columns)))
+    return f'{path}.csv'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run call center scenarios from JSON / TOML files.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="run every scenario of the files")
+    run_parser.add_argument('files', nargs='+', help="JSON or TOML scenario files")
+    run_parser.add_argument('--replications', type=int, default=1, help="replications of scenarios not setting their own")
+    run_parser.add_argument('--seed', type=int, help="seed of scenarios not setting their own")
+    run_parser.add_argument('--processes', type=int, help="worker processes, all cores by default")
+    run_parser.add_argument('--confidence', type=float, default=0.95, help="confidence level of the summary")
+    run_parser.add_argument('--out', default='results', help="prefix of the output files")
+    run_parser.add_argument('--format', choices=FORMATS, default='csv', help="output file format")
+    args = parser.parse_args(argv)
+    if args.format == 'parquet' and pyarrow is None:
+        parser.error("parquet output needs pyarrow, use --format csv or npz")
+
+    try:
+        scenarios = [scenario for path in args.files for scenario in load_scenarios(path)]
+    except RuntimeError as error:
+        parser.error(str(error))
+    names = [name for name, _, _, _ in scenarios]
+    if len(set(names)) != len(names):
+        parser.error("scenario names have to be unique")
+
+    tasks = _tasks(scenarios, args.replications, args.seed)
+    print(f"Running {len(scenarios)} scenario(s), {len(tasks)} run(s)")
+    results = run_scenario_tasks(tasks, args.processes)
+
+    for table, suffix in ((runs_table(results), 'runs'), (summary_table(results, args.confidence), 'summary')):
+        print(f"Written {write_table(table, f'{args.out}_{suffix}', args.format)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import math
+from statistics import NormalDist
+import numpy as np
+
+EXACT_T_DOF = 30  # up to this many degrees of freedom t_quantile inverts the exact t distribution
+
+
+def _t_coverage(theta, dof):
+    """P(|T| < sqrt(dof) * tan(theta)) for Student t with integer dof (Abramowitz & Stegun 26.7.3, 26.7.4)."""
+    cos2 = math.cos(theta) ** 2
+    term, total = 1.0, 0.0
+    if dof % 2:
+        for k in range(1, (dof - 1) // 2 + 1):
+            total += term
+            term *= 2 * k / (2 * k + 1) * cos2
+        return 2 / math.pi * (theta + math.sin(theta) * math.cos(theta) * total)
+    for k in range(1, dof // 2 + 1):
+        total += term
+        term *= (2 * k - 1) / (2 * k) * cos2
+    return math.sin(theta) * total
+
+
+def t_quantile(confidence, dof):
+    """Two-sided Student t quantile.
+
+    Exact (bisection on the distribution function) up to EXACT_T_DOF degrees of freedom, the
+    Cornish-Fisher expansion around the normal quantile above, where its error is below 1e-5.
+    """
+    if dof <= 0:
+        return float('inf')
+    if dof <= EXACT_T_DOF:
+        low, high = 0.0, math.pi / 2
+        for _ in range(60):
+            theta = (low + high) / 2
+            if _t_coverage(theta, dof) < confidence:
+                low = theta
+            else:
+                high = theta
+        return math.sqrt(dof) * math.tan((low + high) / 2)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / dof + g2 / dof ** 2 + g3 / dof ** 3 + g4 / dof ** 4
+
+
+def confidence_interval(values, confidence=0.95):
+    """Mean, standard deviation and half-width of the t confidence interval of the values."""
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    mean = values.mean() if n else float('nan')
+    if n < 2:
+        return mean, float('nan'), float('inf')
+    std = values.std(ddof=1)
+    return mean, std, t_quantile(confidence, n - 1) * std / np.sqrt(n)
+
+
+def mser_truncation(observations, batch_size=5):
+    """Warm-up length chosen by MSER-5: the truncation point minimising the marginal standard error.
+
+    Observations are averaged in batches of batch_size, the truncation is searched in the first half
+    of the batches only, as the statistic is unreliable close to the end of the series.
+    """
+    observations = np.asarray(observations, dtype=float)
+    batches = len(observations) // batch_size
+    if batches < 4:
+        return 0
+    means = observations[:batches * batch_size].reshape(batches, batch_size).mean(axis=1)
+    remaining = batches - np.arange(batches)
+    tail_sum = np.cumsum(means[::-1])[::-1]
+    tail_squares = np.cumsum((means ** 2)[::-1])[::-1]
+    statistic = (tail_squares - tail_sum ** 2 / remaining) / remaining ** 2
+    return int(np.argmin(statistic[:batches // 2 + 1])) * batch_size
+
+
+class BatchedSeries:
+    """Series of observations kept as at most capacity means of equally sized batches.
+
+    Observations are summed into the open batch; when capacity batch means are stored, neighbouring
+    pairs are merged and the batch size doubles. Memory stays bounded however long the series grows,
+    and MSER or batch means run on the stored means instead of every observation.
+    """
+    def __init__(self, capacity=4096):
+        if capacity < 2 or capacity % 2:
+            raise ValueError("capacity has to be an even number of at least 2")
+        self.capacity = capacity
+        self.batch_size = 1
+        self.means = []
+        self._sum = 0.0
+        self._count = 0
+
+    def append(self, value):
+        self._sum += value
+        self._count += 1
+        if self._count == self.batch_size:
+            self.means.append(self._sum / self._count)
+            self._sum = 0.0
+            self._count = 0
+            if len(self.means) == self.capacity:
+                means = self.means
+                self.means = [(first + second) / 2 for first, second in zip(means[::2], means[1::2])]
+                self.batch_size *= 2
+
+    def __len__(self):
+        """Observations in complete batches."""
+        return len(self.means) * self.batch_size
+
+
+def batch_means(observations, batches=20, confidence=0.95):
+    """Mean and confidence half-width of a correlated series from non-overlapping batch means."""
+    observations = np.asarray(observations, dtype=float)
+    batch_size = len(observations) // batches
+    if batch_size == 0:
+        return (observations.mean() if len(observations) else float('nan')), float('inf')
+    means = observations[:batch_size * batches].reshape(batches, batch_size).mean(axis=1)
+    mean, _, half_width = confidence_interval(means, confidence)
+    return mean, half_width
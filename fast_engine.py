@@ -0,0 +1,407 @@
+"""Event-calendar engine for the network model, a fast path beside SimPy.
+
+Runs the same networks as network.py (any NetworkSpec, the classic model through
+three_department_spec) without generator processes: the calendar is a heapq of
+(time, sequence, callback, argument) tuples and every event is a plain method call. Stations keep
+their consultants in flat lists, ended or preempted calls are recognised by a token instead of
+interrupting a process. Arrivals, service and routing draw from the same pools and SimulationContext
+as the SimPy model and fill the same Results and streaming statistics, so results are statistically
+equivalent; runs are not bit-identical because random numbers are consumed in a different order.
+
+Per-event bookkeeping is kept to list appends: queue samples and processed clients are buffered and
+moved into Results in blocks (before every progress report and at the end of the run), and breaks
+are credited when they start instead of with an event at their end.
+
+On the default scenario a run takes about a quarter of the SimPy time (python benchmark.py run). What
+is left is per-client work in Python - routing draws, service times, PS completions and statistics -
+spread evenly enough that no single hot spot remains.
+"""
+import heapq
+from collections import deque
+
+from network import SimulationContext, Results, ServiceTimes, ProcessorSharing
+from arrivals import admit_client, expected_arrivals, time_limit
+from network_spec import MatrixRoute, validate_spec
+from simulation_log import SimulationLog, DEBUG, CALL, BREAK
+from stopping import SimulationCancelled
+
+FLUSH_SIZE = 4096  # buffered queue samples per station before they are moved into Results
+
+
+class Flag:
+    """Event of the fast environment, only knows whether it happened and whom to tell."""
+    __slots__ = ('triggered', 'callbacks')
+
+    def __init__(self):
+        self.triggered = False
+        self.callbacks = []
+
+    def succeed(self, value=None):
+        if not self.triggered:
+            self.triggered = True
+            for callback in self.callbacks:
+                callback()
+
+
+class FastEnvironment:
+    """Event calendar with the part of the SimPy Environment interface used by contexts and stopping rules."""
+    def __init__(self):
+        self.now = 0.0
+        self.calendar = []
+        self._sequence = 0
+        self.processed_events = 0
+
+    def schedule(self, delay, callback, argument=None):
+        self._sequence += 1
+        heapq.heappush(self.calendar, (self.now + delay, self._sequence, callback, argument))
+
+    def event(self):
+        return Flag()
+
+    def timeout(self, delay):
+        flag = Flag()
+        self.schedule(delay, Flag.succeed, flag)
+        return flag
+
+    def any_of(self, events):
+        flag = Flag()
+        for event in events:
+            if event.triggered:
+                flag.triggered = True
+            event.callbacks.append(flag.succeed)
+        return flag
+
+    def run(self, until=None):
+        """Process events before time until, or until the given event is triggered."""
+        calendar = self.calendar
+        pop = heapq.heappop
+        processed = 0
+        if until is None or hasattr(until, 'triggered'):
+            while calendar and not (until is not None and until.triggered):
+                self.now, _, callback, argument = pop(calendar)
+                callback(argument)
+                processed += 1
+        else:
+            while calendar and calendar[0][0] < until:
+                self.now, _, callback, argument = pop(calendar)
+                callback(argument)
+                processed += 1
+            self.now = max(self.now, until)
+        self.processed_events += processed
+
+
+class ConsultantTotals:
+    """Per consultant counters, read like Consultant objects by calculate_average_consultant_times."""
+    __slots__ = ('consultant_name', 'department', 'handled_calls', 'time_on_calls', 'time_on_breaks')
+
+    def __init__(self, name, department):
+        self.consultant_name = name
+        self.department = department
+        self.handled_calls = 0
+        self.time_on_calls = 0
+        self.time_on_breaks = 0
+
+
+class Station(ServiceTimes):
+    """State shared by the stations of the fast engine."""
+    def __init__(self, env, spec, context):
+        self.env = env
+        self.department_name = spec.name
+        self.context = context
+        self.processing_time = spec.service
+        self.samplers = {}
+        self.route = None
+        self.consultants = [ConsultantTotals(f"Consultant {index}", spec.name) for index in range(1, spec.servers + 1)]
+        self.results = Results(context.record_on_change)
+        self.statistics = context.statistics.department(spec.name)
+        self.log = context.log
+        # samples buffered as plain lists, moved into results and statistics by _flush
+        self._queue_times = []
+        self._queue_sizes = []
+        self._processed_times = []
+
+    def _register_processed_clients(self):
+        self._processed_times.append(self.env.now)
+
+    def _record_queue_size(self, size):
+        times = self._queue_times
+        times.append(self.env.now)
+        self._queue_sizes.append(size)
+        if len(times) == FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Move the buffered samples into Results and the queue-length statistics."""
+        if self._queue_times:
+            self.results.record_queue_block(self._queue_times, self._queue_sizes)
+            self.statistics.queue_length.update_many(self._queue_times, self._queue_sizes)
+            self._queue_times, self._queue_sizes = [], []
+        if self._processed_times:
+            self.results.record_processed_block(self._processed_times)
+            self._processed_times = []
+
+    def _finish_run(self):
+        """Bring results and consultant totals up to date when the run stops."""
+        self._flush()
+
+
+class ConsultantStation(Station):
+    """FIFO or priority (LIFOPR) station, every consultant serves one client at a time.
+
+    Free consultants are taken lowest index first. A call ends with an event carrying the token of
+    the call; preemption bumps the consultant's token, so the pending end of the interrupted call is ignored.
+    """
+    def __init__(self, env, spec, context, priority=False, preemptive=False):
+        super().__init__(env, spec, context)
+        self.priority = priority
+        self.preemptive = preemptive
+        self.queue = [] if priority else deque()  # heap of (-priority, -sequence, client) with priorities
+        self._sequence = 0
+        servers = spec.servers
+        self.free = list(range(servers))  # heap of free consultant indexes
+        self.clients = [None] * servers
+        self.tokens = [0] * servers
+        self.call_start = [0.0] * servers
+        self.call_length = [0.0] * servers
+        self.log_calls = self.log.enabled(CALL)
+        self.log_breaks = self.log.enabled(BREAK, DEBUG)
+        self.wait_kpi = f"{spec.name}_wait"
+        self.wait_statistics = self.statistics.wait
+        self.time_statistics = self.statistics.time_in_department
+        self._breaks = deque()  # (end, consultant, duration) of breaks credited at their start, oldest first
+
+    def _queue_size(self):
+        return len(self.queue)
+
+    def _add_client(self, client):
+        if client.remaining_service is None:  # not coming back after a preemption
+            client.entered_department = self.env.now
+        client.current_department = self.department_name
+        if self.free:  # nobody waits while a consultant is free, the client only passes through the queue
+            self._record_queue_size(1)
+            self._record_queue_size(0)
+            self._start_call(heapq.heappop(self.free), client)
+            return
+        if self.priority:
+            self._sequence += 1
+            heapq.heappush(self.queue, (-client.priority, -self._sequence, client))
+        else:
+            self.queue.append(client)
+        self._record_queue_size(len(self.queue))
+        if self.preemptive:
+            self._preempt_for(client)
+
+    def _take_client(self):
+        client = heapq.heappop(self.queue)[2] if self.priority else self.queue.popleft()
+        self._record_queue_size(len(self.queue))
+        return client
+
+    def _preempt_for(self, client):
+        """Interrupt the lowest-priority call if that client is less important than the new one."""
+        if None in self.clients:
+            return  # a consultant is finishing a call, it starts its next one after routing (as in network.py)
+        victim = min(range(len(self.clients)), key=lambda index: self.clients[index].priority, default=None)
+        if victim is None or self.clients[victim].priority >= client.priority:
+            return
+        preempted = self.clients[victim]
+        served = self.env.now - self.call_start[victim]
+        preempted.remaining_service = self.call_length[victim] - served
+        preempted.last_wait = self.env.now
+        self.consultants[victim].time_on_calls += served
+        self.tokens[victim] += 1  # the pending end of the call is ignored
+        self.clients[victim] = None
+        # the consultant picks up the most important waiting client, then the preempted one queues again
+        self._start_call(victim, self._take_client())
+        self._add_client(preempted)
+
+    def _start_call(self, index, client):
+        consultant = self.consultants[index]
+        if client.remaining_service is not None:
+            service_time = client.remaining_service
+            client.remaining_service = None
+        else:
+            consultant.handled_calls += 1
+            service_time = self._draw_service_time(client.issue_code)
+        now = self.env.now
+        wait_time = now - client.last_wait
+        self.wait_statistics.add(wait_time)
+        if self.context.kpi_observations is not None:
+            self.context._observe(self.wait_kpi, wait_time)
+        if self.log_calls:
+            self.log.write("%s: %s is handling %s for %.2f seconds (Wait time: %.2f seconds).",
+                           self.department_name, consultant.consultant_name, client.client_name, service_time, wait_time)
+
+        self.clients[index] = client
+        self.call_start[index] = now
+        self.call_length[index] = service_time
+        self.tokens[index] += 1
+        self.env.schedule(service_time, self._end_call, (index, self.tokens[index]))
+
+    def _end_call(self, argument):
+        index, token = argument
+        if token != self.tokens[index]:
+            return  # preempted
+        client = self.clients[index]
+        self.clients[index] = None
+        service_time = self.call_length[index]
+        consultant = self.consultants[index]
+        consultant.time_on_calls += service_time
+        now = client.last_wait = self.env.now
+
+        # breaks are only accounted, the consultant is available again right away (as in network.py); the break
+        # is credited now instead of with an event at its end, _finish_run takes back breaks still running
+        break_duration = max(service_time / 3, 1)
+        if self.log_breaks:
+            self.log.write("%s: %s is taking a break for %.2f seconds", self.department_name, consultant.consultant_name, break_duration)
+        consultant.time_on_breaks += break_duration
+        breaks = self._breaks
+        breaks.append((now + break_duration, consultant, break_duration))
+        while breaks[0][0] < now:
+            breaks.popleft()
+
+        # the consultant takes the next waiting client before the finished one is routed, a client coming
+        # back to this station queues behind it (as the processes of network.py do)
+        next_client = self._take_client() if self.queue else None
+        self.time_statistics.add(now - client.entered_department)
+        self.route._route_client(client)
+        self._register_processed_clients()
+
+        if next_client is None and self.queue:
+            next_client = self._take_client()
+        if next_client is not None:
+            self._start_call(index, next_client)
+        else:
+            heapq.heappush(self.free, index)
+
+    def _finish_run(self):
+        super()._finish_run()
+        for end, consultant, break_duration in self._breaks:
+            if end >= self.env.now:
+                consultant.time_on_breaks -= break_duration
+        self._breaks.clear()
+
+
+class ProcessorSharingStation(ProcessorSharing, Station):
+    """PS station with the virtual clock of network.ProcessorSharing, one pending event for the next completion.
+
+    An arrival only moves the pending event when the next completion comes earlier. When it comes later
+    (the rate drops), the pending event wakes the station early and is simply scheduled again.
+    """
+    def __init__(self, env, spec, context):
+        super().__init__(env, spec, context)
+        self._init_processor_sharing()
+        self._token = 0
+        self._wake_up = None  # time of the pending event
+
+    def _schedule_completion(self):
+        next_completion = self._next_completion()
+        if next_completion is None:
+            return
+        wake_up = self.env.now + next_completion
+        if self._wake_up is not None and self._wake_up <= wake_up:
+            return
+        self._token += 1
+        self._wake_up = wake_up
+        self.env.schedule(next_completion, self._complete, self._token)
+
+    def _add_client(self, client):
+        self._admit_client(client)
+        self._schedule_completion()
+
+    def _complete(self, token):
+        if token != self._token:
+            return  # replaced by an earlier completion
+        self._wake_up = None
+        self._complete_due_clients()
+        self._schedule_completion()
+
+
+def build_fast_network(env, spec, context):
+    """Stations and MatrixRoute of a network spec on the fast environment."""
+    validate_spec(spec)
+    context.classes = tuple(spec.classes)
+    stations = []
+    for station in spec.stations:
+        if station.discipline == 'ps':
+            stations.append(ProcessorSharingStation(env, station, context))
+        else:
+            stations.append(ConsultantStation(env, station, context, priority=station.discipline == 'lifopr',
+                                              preemptive=station.preemptive))
+    route = MatrixRoute(stations, spec, context)
+    for station in stations:
+        station.route = route
+        context.consultants.extend(station.consultants)
+    return stations, route
+
+
+class ArrivalGenerator:
+    """Admits the clients of an arrival process (see arrivals), one calendar entry for the next arrival."""
+    def __init__(self, env, process, clients, route):
+        self.env = env
+        self.route = route
+        self.clients = expected_arrivals(process, clients)
+        self.client_id = 0
+        self.blocks = process.blocks(route.context)
+        self.times = []
+        self.codes = None
+        self.index = 0
+        route.context._expect_clients(self.clients)
+        self._schedule_next()
+
+    def _schedule_next(self):
+        if self.client_id == self.clients:
+            return
+        while self.index == len(self.times):
+            block = next(self.blocks, None)
+            if block is None:
+                return
+            times, self.codes = block
+            self.times = times.tolist()
+            self.index = 0
+        self.env.schedule(self.times[self.index] - self.env.now, self._arrive,
+                          None if self.codes is None else self.codes[self.index])
+        self.index += 1
+
+    def _arrive(self, issue_code):
+        self.client_id += 1
+        admit_client(self.route, self.client_id, self.env.now, issue_code)
+        self._schedule_next()
+
+
+class ProgressReporter:
+    def __init__(self, env, context, progress, interval, stations):
+        self.env = env
+        self.context = context
+        self.progress = progress
+        self.interval = interval
+        self.stations = stations
+        self.results = {station.department_name: station.results for station in stations}
+        env.schedule(interval, self._report)
+
+    def _report(self, _):
+        for station in self.stations:
+            station._flush()
+        if self.progress(self.env.now, self.context.exited_clients, self.results) is False:
+            raise SimulationCancelled(f"cancelled at time {self.env.now:.2f}")
+        self.env.schedule(self.interval, self._report)
+
+
+def run_fast(spec, clients, arrivals, stop, log_levels=None, log_sink=None, seed=None, record_on_change=False,
+             progress=None, progress_interval=None, antithetic=False):
+    """Simulate a network spec on the event calendar, returns (stations, context, env).
+
+    arrivals is an arrival process and stop a rule object of stopping, both used like in run_simulation.
+    """
+    env = FastEnvironment()
+    context = SimulationContext(env, SimulationLog(log_levels, log_sink), seed, record_on_change, antithetic)
+    stations, route = build_fast_network(env, spec, context)
+
+    stop.prepare(context)
+    if progress is not None:
+        ProgressReporter(env, context, progress, progress_interval, stations)
+    ArrivalGenerator(env, arrivals, None if stop.unbounded_arrivals else clients, route)
+    stop.run(env, context, time_limit(arrivals, clients))
+    for station in stations:
+        station._finish_run()
+    context.log.flush()
+    return stations, context, env
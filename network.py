@@ -1,48 +1,409 @@
 from datetime import datetime
+from collections import deque
+import heapq
 import simpy as sp
 import numpy as np
-import random
+from itertools import accumulate
+from sampling import RandomStreams
+from streaming import RunStatistics
+from simulation_log import SimulationLog, DEBUG, ARRIVAL, CALL, BREAK, PS, EXIT
+
+
+class SimulationContext:
+    """State owned by a single simulation run.
+
+    Every department, consultant and route of one run shares the context, so two runs never mix their
+    clients, consultants or random numbers. Random draws of the run come from streams, one generator per
+    purpose derived from seed (an int or a numpy SeedSequence, None for fresh entropy), so scenarios run with
+    the same seed share common random numbers; antithetic gives the mirrored run of a pair. record_on_change is passed
+    to Results of every department. Clients are not kept after they leave the network, statistics
+    holds streaming accumulators updated at event time instead. classes names the client classes
+    (issue types) by code, ISSUE_TYPES unless a generic network defines its own.
+    """
+    def __init__(self, env, log=None, seed=None, record_on_change=False, antithetic=False):
+        self.env = env
+        self.log = log if log is not None else SimulationLog()
+        self.streams = RandomStreams(seed, antithetic)
+        self.rng = self.streams.generator('default')  # draws without a purpose of their own
+        self.record_on_change = record_on_change
+        self.classes = ISSUE_TYPES
+        self.consultants = []
+        self.statistics = RunStatistics()
+        self.client_pool = ClientPool()
+
+        # Termination tracking
+        self.expected_clients = None  # number of clients that will be generated, None when unbounded
+        self.exited_clients = 0
+        self.all_exited = env.event()
+        self.kpi_observations = None  # {'kpi': series with append} when a stopping rule asks for them
+
+    def _expect_clients(self, number_of_clients):
+        self.expected_clients = number_of_clients
+        if number_of_clients == 0 and not self.all_exited.triggered:
+            self.all_exited.succeed()
+
+    def _client_exited(self, client):
+        self.exited_clients += 1
+        sojourn = self.env.now - client.arrival_time
+        self.statistics.department(client.current_department).sojourn.add(sojourn)
+        if self.kpi_observations is not None:
+            self._observe('sojourn', sojourn)
+        self.client_pool.release(client)
+        if self.exited_clients == self.expected_clients:
+            self.all_exited.succeed()
+
+    def _observe(self, kpi, value):
+        observations = self.kpi_observations.get(kpi)
+        if observations is not None:
+            observations.append(value)
+
+class Column:
+    """Growable typed array with amortised O(1) append.
+
+    Behaves like a list for appending, indexing and iteration and gives zero-copy NumPy views of the
+    stored values. A view stays valid until an append has to grow the buffer.
+    """
+    def __init__(self, dtype, values=(), capacity=256):
+        values = np.asarray(values, dtype=dtype)
+        self._data = np.empty(max(capacity, len(values)), dtype=dtype)
+        self._data[:len(values)] = values
+        self._size = len(values)
+
+    def append(self, value):
+        if self._size == len(self._data):
+            grown = np.empty(2 * len(self._data), dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        size = self._size + len(values)
+        if size > len(self._data):
+            grown = np.empty(max(2 * len(self._data), size), dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size:size] = values
+        self._size = size
+
+    def clear(self):
+        self._size = 0
+
+    def view(self):
+        """NumPy view of the stored values without copying."""
+        return self._data[:self._size]
+
+    @property
+    def nbytes(self):
+        return self._size * self._data.itemsize
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __array__(self, dtype=None, copy=None):
+        view = self.view()
+        return view if dtype is None else view.astype(dtype)
+
+    def __reduce__(self):
+        # only the stored values are pickled, not the spare capacity
+        return Column, (self._data.dtype, self.view())
 
-all_clients = []
-all_consultants = []
 
 class Results:
-    def __init__(self):
-        self.queue_size = [0]
-        self.queue_change_time = [0]
-        self.processed_clients = [0]
-        self.processed_clients_time = [0]
+    """Columnar record of queue sizes and processed clients of one department.
+
+    With record_on_change set a queue sample is stored only when the queue size differs from the
+    previous one, which is enough to rebuild the step function and saves most of the samples.
+    counts_in_service tells whether queue_size includes clients being served (PS) or only waiting ones.
+    servers, busy_time and statistics are filled in at the end of a run.
+    """
+    def __init__(self, record_on_change=False, counts_in_service=False):
+        self.record_on_change = record_on_change
+        self.counts_in_service = counts_in_service
+        self.servers = 0
+        self.busy_time = 0.0  # time on calls summed over consultants
+        self.statistics = None  # DepartmentStatistics of the run
+        self.queue_size = Column(np.int32, [0])
+        self.queue_change_time = Column(np.float64, [0])
+        self.processed_clients = Column(np.int32, [0])
+        self.processed_clients_time = Column(np.float64, [0])
+
+    def record_queue(self, time, size):
+        if self.record_on_change and size == self.queue_size[-1]:
+            return
+        self.queue_size.append(size)
+        self.queue_change_time.append(time)
+
+    def record_processed(self, time):
+        self.processed_clients.append(self.processed_clients[-1] + 1)
+        self.processed_clients_time.append(time)
+
+    def record_queue_block(self, times, sizes):
+        """record_queue for every (time, size) pair in order, for samples buffered by the caller."""
+        times = np.asarray(times, dtype=np.float64)
+        sizes = np.asarray(sizes, dtype=np.int32)
+        if self.record_on_change:
+            changed = sizes != np.concatenate(([self.queue_size[-1]], sizes[:-1]))
+            times, sizes = times[changed], sizes[changed]
+        self.queue_size.extend(sizes)
+        self.queue_change_time.extend(times)
+
+    def record_processed_block(self, times):
+        """record_processed for every time in order."""
+        self.processed_clients.extend(self.processed_clients[-1] + np.arange(1, len(times) + 1))
+        self.processed_clients_time.extend(times)
+
+    def as_arrays(self):
+        """Zero-copy NumPy views of all recorded columns."""
+        return {
+            'queue_size': self.queue_size.view(),
+            'queue_change_time': self.queue_change_time.view(),
+            'processed_clients': self.processed_clients.view(),
+            'processed_clients_time': self.processed_clients_time.view()
+        }
 
 
 class Client:
-    def __init__(self, client_id, issue_type, arrival_time, priority=0):
+    """Client travelling through the network.
+
+    Slotted to keep the per-client footprint small: the issue type is stored as its code in
+    ISSUE_TYPES (or the classes of the network) and the issue history is packed into an int,
+    HISTORY_BITS per visited issue type. Names and histories are only decoded when asked for,
+    issue_type and issue_history use the names of ISSUE_TYPES.
+    """
+    __slots__ = ('client_id', 'issue_code', 'arrival_time', 'current_department', 'priority', 'history',
+                 'history_length', 'last_wait', 'entered_department', 'remaining_service')
+
+    def __init__(self, client_id, issue_code, arrival_time, priority=0):
+        self._reset(client_id, issue_code, arrival_time, priority)
+
+    def _reset(self, client_id, issue_code, arrival_time, priority=0):
         self.client_id = client_id
-        self.client_name = f"Client {client_id}"
-        self.issue_type = issue_type  # 'normal', 'medium', 'complicated'
+        self.issue_code = issue_code  # index in ISSUE_TYPES
         self.arrival_time = arrival_time # env.now()
         self.current_department = None # keeping track of current department
         self.priority = priority # in range 0 to inf, at start max value 10 for complicated cases increase with each convertion of class
-        self.issue_history = []
+        self.history = 0  # packed issue codes, the first one in the lowest bits
+        self.history_length = 0
         self.last_wait = arrival_time
-        self.wait_times = []
+        self.entered_department = arrival_time
+        self.remaining_service = None # service time left after being preempted, resumed on the next call
+
+    @property
+    def client_name(self):
+        return f"Client {self.client_id}"
+
+    @property
+    def issue_type(self):
+        return ISSUE_TYPES[self.issue_code]
+
+    @issue_type.setter
+    def issue_type(self, issue_type):
+        self.issue_code = ISSUE_CODES[issue_type]
+
+    def _record_issue(self, issue_code):
+        self.history |= issue_code << (HISTORY_BITS * self.history_length)
+        self.history_length += 1
+
+    def history_codes(self):
+        """Issue codes the client went through, oldest first."""
+        mask = (1 << HISTORY_BITS) - 1
+        return [(self.history >> (HISTORY_BITS * index)) & mask for index in range(self.history_length)]
+
+    @property
+    def issue_history(self):
+        """Issue types the client went through, oldest first."""
+        return [ISSUE_TYPES[code] for code in self.history_codes()]
+
 
+class ClientPool:
+    """Free list of Client objects, clients leaving the network are reused for new arrivals.
 
-class Department:
-    def __init__(self, env, name):
+    The number of Client objects alive is bounded by the number of clients in the network at once,
+    not by the total number of arrivals. A released client must not be referenced anymore.
+    """
+    def __init__(self):
+        self.free = []
+        self.created = 0
+
+    def acquire(self, client_id, issue_code, arrival_time, priority=0):
+        if self.free:
+            client = self.free.pop()
+            client._reset(client_id, issue_code, arrival_time, priority)
+            return client
+        self.created += 1
+        return Client(client_id, issue_code, arrival_time, priority)
+
+    def release(self, client):
+        self.free.append(client)
+
+
+class ClientPriorityStore(sp.Store):
+    """Store handing out the client with the highest priority, LIFO among equal priorities.
+
+    Items are kept in a heap of (-priority, -arrival_sequence, client), so put and get are O(log n).
+    """
+    def __init__(self, env):
+        super().__init__(env)
+        self._sequence = 0
+
+    def _do_put(self, event):
+        if len(self.items) < self._capacity:
+            self._sequence += 1
+            heapq.heappush(self.items, (-event.item.priority, -self._sequence, event.item))
+            event.succeed()
+
+    def _do_get(self, event):
+        if self.items:
+            event.succeed(heapq.heappop(self.items)[2])
+
+
+class ServiceTimes:
+    """Service-time sampling of a department, shared with the stations of fast_engine.
+
+    Expects context, department_name, processing_time ({issue type: rate}) and samplers ({issue code: VariatePool}).
+    """
+    def _create_sampler(self, issue_type):
+        """Pool of exponential service times for the issue type."""
+        return self.context.streams.exponential(f'service/{self.department_name}/{issue_type}', self.processing_time[issue_type])
+
+    def _draw_service_time(self, issue_code):
+        """Take the next pre-sampled service time for the issue code."""
+        sampler = self.samplers.get(issue_code)
+        if sampler is None:
+            sampler = self.samplers[issue_code] = self._create_sampler(self.context.classes[issue_code])
+        return sampler.next()
+
+
+class ProcessorSharing(ServiceTimes):
+    """Processor Sharing (PS) service, shared by DepartmentPS and the PS station of fast_engine.
+
+    Every active client is served at rate min(1, c/n), where c is the number of consultants
+    and n the number of active clients. Instead of tracking remaining work of each client
+    separately, the department keeps a virtual clock equal to the service attained by every
+    active client so far. A client finishes when the virtual clock reaches its finish tag
+    (virtual clock at arrival + drawn work), so its remaining work is always finish tag - virtual clock.
+    The engine only has to wake the department after _next_completion and on arrivals.
+    """
+    def _init_processor_sharing(self):
+        self.results.counts_in_service = True
+        self.log_service = self.log.enabled(PS)
+        self.active_clients = []  # heap of (finish_tag, sequence, client)
+        self.virtual_time = 0
+        self.last_update = 0
+        self.served_clients = 0
+        self._sequence = 0
+
+    def _create_sampler(self, issue_type):
+        """Pool of service times drawn from the Cox distribution of the issue type."""
+        cox_params = self.processing_time[issue_type]
+        return self.context.streams.cox(f'service/{self.department_name}/{issue_type}',
+                                        cox_params['phases'], cox_params['rates'], cox_params['weights'])
+
+    def _service_rate(self):
+        """Rate at which each active client is currently served."""
+        if not self.active_clients:
+            return 0
+        return min(1, len(self.consultants) / len(self.active_clients))
+
+    def _advance_virtual_time(self):
+        """Move the virtual clock forward to the current simulation time."""
+        now = self.env.now
+        elapsed = now - self.last_update
+        active = len(self.active_clients)
+        if elapsed > 0 and active:
+            consultants = self.consultants
+            if active < len(consultants):
+                self.virtual_time += elapsed
+                consultants = consultants[:active]
+            else:
+                self.virtual_time += elapsed * (len(consultants) / active)
+            for consultant in consultants:
+                consultant.time_on_calls += elapsed
+        self.last_update = now
+
+    def _admit_client(self, client):
+        """Start sharing the consultants with a new client."""
+        client.current_department = self.department_name
+        client.entered_department = self.env.now
+        self._advance_virtual_time()  # service rate changes from now on
+        self._sequence += 1
+        heapq.heappush(self.active_clients, (self.virtual_time + self._draw_service_time(client.issue_code), self._sequence, client))
+        self._register_queue_change()
+
+    def _complete_due_clients(self):
+        """Bring the virtual clock up to date and finish every client whose work is done.
+
+        Work left below the resolution of the simulation clock counts as done as well: late in a long
+        run one ulp of env.now can exceed the tolerance, a wake-up after that work would not move
+        the clock and the department would wake up at the same time forever.
+        """
+        self._advance_virtual_time()
+        now = self.env.now
+        tolerance = 1e-9 * max(1, self.virtual_time)
+        while self.active_clients:
+            if self.active_clients[0][0] > self.virtual_time + tolerance:
+                next_completion = self._next_completion()
+                if next_completion is None or now + next_completion > now:
+                    break
+            _, _, client = heapq.heappop(self.active_clients)
+            self._finish_client(client)
+
+    def _next_completion(self):
+        """Time until the next client finishes at the current rate, None without active clients."""
+        active_clients = self.active_clients
+        if not active_clients or not self.consultants:
+            return None
+        return max((active_clients[0][0] - self.virtual_time) / min(1, len(self.consultants) / len(active_clients)), 0)
+
+    def _finish_client(self, client):
+        """Send a client who received all of its work to the next department."""
+        if self.consultants:
+            self.consultants[self.served_clients % len(self.consultants)].handled_calls += 1
+        self.served_clients += 1
+        if self.log_service:
+            self.log.write("%s processed  by PS in %s seconds.", client.client_name, self.env.now - client.last_wait)
+        if self.context.kpi_observations is not None:
+            self.context._observe('ps_time', self.env.now - client.last_wait)
+        self.statistics.time_in_department.add(self.env.now - client.entered_department)
+        client.last_wait = self.env.now
+        self.route._route_client(client)
+        self._register_processed_clients()
+        self._register_queue_change()
+
+    def _register_queue_change(self):
+        self._record_queue_size(len(self.active_clients))  # Track number of clients sharing consultants
+
+
+class Department(ServiceTimes):
+    def __init__(self, env, name, context=None):
         self.env = env
         self.department_name = name
+        self.context = context if context is not None else SimulationContext(env)
+        self.log = self.context.log
 
         self.queue = sp.Store(env)  # Created for each department, not used by IS
         self.processing_time = {}  # {'issue_type': mu_value}
+        self.samplers = {}  # {issue code: VariatePool}, created on first use
         self.consultants = []
+        self.consultant_waiters = deque()  # requests waiting for a free consultant, oldest first
         self.route = None
 
         # Data tracking
-        self.results = Results()
+        self.results = Results(self.context.record_on_change)
+        self.statistics = self.context.statistics.department(name)
 
     def _fill_processing_time(self, process_time_dict):
         """Initialize processing times for different issue types."""
         self.processing_time = process_time_dict
+        self.samplers = {}
 
     def _init_route(self, given_route):
         """Init route based on created Route instance in simulation."""
@@ -52,266 +413,343 @@ class Department:
         """Create consultants for the department."""
         for idx in range(1, number_of_consultants + 1):
             consultant_name = f"Consultant {idx}"
-            consultant = Consultant(self.env, consultant_name, self.department_name, self.processing_time)
-            all_consultants.append(consultant)
+            consultant = Consultant(self.env, consultant_name, self.department_name, self.processing_time, unit=self, context=self.context)
+            self.context.consultants.append(consultant)
             self.consultants.append(consultant)
 
     def _add_client(self, client):
         """Add a client to the department queue."""
+        if client.remaining_service is None:  # not coming back after a preemption
+            client.entered_department = self.env.now
         client.current_department = self.department_name
         self.queue.put(client)
         self._register_queue_change()
 
     def _get_available_consultant(self):
-        """Find the first available consultant."""
-        while True:
-            for consultant in self.consultants:
-                if not consultant.busy:
-                    return consultant
-            yield self.env.timeout(0.1)  # Small delay between checks
+        """Claim the first available consultant or wait until one is released."""
+        for consultant in self.consultants:
+            if not consultant.busy:
+                consultant.busy = True
+                return consultant
+        waiter = self.env.event()
+        self.consultant_waiters.append(waiter)
+        consultant = yield waiter
+        return consultant
+
+    def _release_consultant(self, consultant):
+        """Hand a consultant over to the longest-waiting request or mark it as free."""
+        if self.consultant_waiters:
+            self.consultant_waiters.popleft().succeed(consultant)  # stays busy, ownership passes on
+        else:
+            consultant.busy = False
 
     def _register_processed_clients(self):
-        self.results.processed_clients.append(len(self.results.processed_clients) + 1)  # Track queue size
-        self.results.processed_clients_time.append(self.env.now)
+        self.results.record_processed(self.env.now)
 
     def _register_queue_change(self):
-        self.results.queue_size.append(len(self.queue.items))  # Track queue size
-        self.results.queue_change_time.append(self.env.now)
-
-    def _assign_client_to_consultant(self, client):
-        """Assign a consultant to a client and process the call."""
-        consultant = yield from self._get_available_consultant()
-        if consultant:
-            yield self.env.process(consultant._handle_call(client))
-            self.env.process(self.route._route_client(client))
-            self._register_processed_clients()
-            self._register_queue_change()
+        self._record_queue_size(len(self.queue.items))  # Track queue size
 
-class DepartmentPS(Department):
-    """Department with PS (Processor Sharring) processing."""
-    def __init__(self, env, name):
-        super().__init__(env, name)
-        self.active_clients = []
+    def _record_queue_size(self, size):
+        self.results.record_queue(self.env.now, size)
+        self.statistics.queue_length.update(self.env.now, size)
+
+    def _process_clients(self):
+        """Start a call on every free consultant as soon as a client is waiting."""
+        while True:
+            consultant = yield from self._get_available_consultant()
+            client = yield self.queue.get()
+            self._register_queue_change()
+            self.env.process(self._assign_client_to_consultant(client, consultant))
+
+    def _assign_client_to_consultant(self, client, consultant):
+        """Process the call of a client with the given consultant."""
+        completed = yield self.env.process(consultant._handle_call(client))
+        if not completed:  # preempted, client goes back to the queue with the remaining service
+            self._add_client(client)
+            return
+        self.statistics.time_in_department.add(self.env.now - client.entered_department)
+        self.route._route_client(client)
+        self._register_processed_clients()
+
+class DepartmentPS(ProcessorSharing, Department):
+    """Department with PS (Processor Sharring) processing, see ProcessorSharing."""
+    def __init__(self, env, name, context=None):
+        super().__init__(env, name, context)
+        self._init_processor_sharing()
+        self._arrival = env.event()
 
     def _generate_cox_time(self, client):
         """Generate service time using Cox distribution."""
-        cox_params = self.processing_time[client.issue_type]
-        phases = cox_params['phases']
-        rates = cox_params['rates']
-        weights = cox_params['weights']
-
-        phase = np.random.choice(phases, p=weights)
-        return np.random.exponential(1 / rates[phase])
+        return self._draw_service_time(client.issue_code)
 
     def _process_clients(self):
-        """Process clients using Processor Sharing."""
+        """Process clients using Processor Sharing, waking only on arrivals and departures."""
         while True:
-            if self.active_clients:
-                total_clients = len(self.active_clients)
-                time_slice = 1.0 / total_clients
-
-                for client in self.active_clients[:]:
-                    consultant = yield from self._get_available_consultant()
-
-                    if consultant:
-                        remaining_service_time = self._generate_cox_time(client)
-                        allocated_time = min(time_slice, remaining_service_time)
+            self._complete_due_clients()
+            next_completion = self._next_completion()
+            if next_completion is not None:
+                yield self.env.timeout(next_completion) | self._arrival
+            else:
+                yield self._arrival
 
-                        consultant.busy = True
-                        yield self.env.timeout(allocated_time)
-                        remaining_service_time -= allocated_time
-
-                        if remaining_service_time <= 0:
-                            self.active_clients.remove(client)
-                            print(f"{client.client_name} processed  by PS in {self.env.now - client.last_wait} seconds.")
-                            client.last_wait = self.env.now
-                            self.env.process(self.route._route_client(client))
-                            self._register_processed_clients()
-                            self._register_queue_change()
-                        consultant.busy = False
-
-            yield self.env.timeout(0.1)  # Małe opóźnienie między iteracjami
+            if self._arrival.triggered:
+                self._arrival = self.env.event()
 
     def _add_client(self, client):
         """Add a client to the department for processing."""
-        client.current_department = self.department_name
-        self.active_clients.append(client)
+        self._admit_client(client)
+        if not self._arrival.triggered:
+            self._arrival.succeed()
 
 class DepartmentFIFO(Department):
-    def __init__(self, env, name):
-        super().__init__(env, name)
-
-    def _process_clients(self):
-        """Process clients in FIFO order."""
-        while True:
-            client = yield self.queue.get()  # Pobierz klienta z kolejki
-            yield self.env.process(self._assign_client_to_consultant(client))  # Przetwarzaj osobno każdego klienta
+    """Department with FIFO processing, clients are taken from the queue in order of arrival."""
+    def __init__(self, env, name, context=None):
+        super().__init__(env, name, context)
 
 class DepartmentLIFOPR(Department):
-    """Department with lifo with priorities."""
-    def __init__(self, env, name):
-        super().__init__(env, name)
+    """Department with lifo with priorities.
 
-    def _process_clients(self):
-        while True:
-            if len(self.queue.items) > 0:
-                self.queue.items.sort(key=lambda c: c.priority, reverse=True)
-                client = self.queue.items.pop()
-                yield self.env.process(self._assign_client_to_consultant(client))
-            yield self.env.timeout(0.01)
+    With preemptive set, a client arriving while every consultant is on a call interrupts the call
+    of the lowest-priority client if that one is less important. The interrupted client returns to the
+    queue and resumes the remaining service later (preemptive-resume).
+    """
+    def __init__(self, env, name, preemptive=False, context=None):
+        super().__init__(env, name, context)
+        self.queue = ClientPriorityStore(env)
+        self.preemptive = preemptive
+
+    def _add_client(self, client):
+        """Add a client to the priority queue, preempting a less important call if needed."""
+        super()._add_client(client)
+        if self.preemptive:
+            self._preempt_for(client)
+
+    def _preempt_for(self, client):
+        """Interrupt the lowest-priority call when all consultants are talking to less important clients."""
+        candidates = []
+        for consultant in self.consultants:
+            if consultant.current_client is None:
+                if not consultant.preempted:
+                    return  # someone is free or about to pick the client up
+            else:
+                candidates.append(consultant)
+        if not candidates:
+            return
+        victim = min(candidates, key=lambda c: c.current_client.priority)
+        if victim.current_client.priority < client.priority:
+            victim.preempted = True
+            victim.current_client = None
+            victim.call.interrupt()
 
 class Consultant:
-    def __init__(self, env, name, department, processing_time):
+    def __init__(self, env, name, department, processing_time, unit=None, context=None):
         self.env = env
         self.consultant_name = name
         self.department = department
         self.processing_time = processing_time  # {'issue_type': mu_value}
+        self.unit = unit  # Department instance notified when the consultant becomes free
+
+        self.context = context if context is not None else SimulationContext(env)
+        self.log = self.context.log
+        self.log_calls = self.log.enabled(CALL)
+        self.log_breaks = self.log.enabled(BREAK, DEBUG)
+        self.wait_kpi = f"{department}_wait"
+        self.wait_statistics = self.context.statistics.department(department).wait
 
         self.busy = False
-        self.loggs = True
         self.handled_calls = 0
         self.break_duration = 0
         self.time_on_breaks = 0
         self.time_on_calls = 0
         self.time_on_previous_call = 0
+        self.current_client = None
+        self.call = None # process of the ongoing call, interrupted on preemption
+        self.preempted = False
 
     def _handle_call(self, client):
-        """Simulates handling a call by the consultant."""
+        """Simulates handling a call by the consultant, returns False when the call got preempted."""
         self.busy = True
-        self.handled_calls += 1
-
-        service_time = np.random.exponential(1 / self.processing_time[client.issue_type])
+        self.current_client = client
+        self.call = self.env.active_process
+
+        if client.remaining_service is not None:
+            service_time = client.remaining_service
+            client.remaining_service = None
+        else:
+            self.handled_calls += 1
+            if self.unit is not None:
+                service_time = self.unit._draw_service_time(client.issue_code)
+            else:
+                service_time = self.context.rng.exponential(1 / self.processing_time[self.context.classes[client.issue_code]])
         wait_time = self.env.now - client.last_wait
-        client.wait_times.append((wait_time, self.department))
-        if self.loggs:
-            print(f"{self.department}: {self.consultant_name} is handling {client.client_name} for {service_time:.2f} seconds "
-                  f"(Wait time: {wait_time:.2f} seconds).")
+        self.wait_statistics.add(wait_time)
+        if self.context.kpi_observations is not None:
+            self.context._observe(self.wait_kpi, wait_time)
+        if self.log_calls:
+            self.log.write("%s: %s is handling %s for %.2f seconds (Wait time: %.2f seconds).",
+                           self.department, self.consultant_name, client.client_name, service_time, wait_time)
+
+        call_start = self.env.now
+        try:
+            yield self.env.timeout(service_time)
+        except sp.Interrupt:
+            served = self.env.now - call_start
+            client.remaining_service = service_time - served
+            client.last_wait = self.env.now
+            self.time_on_calls += served
+            self._end_call()
+            return False
 
-        yield self.env.timeout(service_time)
         client.last_wait = self.env.now
         self.time_on_calls += service_time
         self.time_on_previous_call = service_time
         self.env.process(self._take_break())
-        self.busy = False
+        self._end_call()
+        return True
+
+    def _end_call(self):
+        """Forget the finished or interrupted call and become available again."""
+        self.current_client = None
+        self.call = None
+        self.preempted = False
+        self._become_available()
+
+    def _become_available(self):
+        """Wake the longest-waiting requester in the department or simply go idle."""
+        if self.unit is not None:
+            self.unit._release_consultant(self)
+        else:
+            self.busy = False
 
     def _take_break(self):
         """Simulates a break between calls."""
-        self.break_duration = max(self.time_on_previous_call / 3, 1)  # at least one-minute break
-        if self.loggs:
-            print(f"{self.department}: {self.consultant_name} is taking a break for {self.break_duration:.2f} seconds")
-        yield self.env.timeout(self.break_duration)
-        self.time_on_breaks += self.break_duration
+        break_duration = self.break_duration = max(self.time_on_previous_call / 3, 1)  # at least one-minute break
+        if self.log_breaks:
+            self.log.write("%s: %s is taking a break for %.2f seconds", self.department, self.consultant_name, break_duration)
+        yield self.env.timeout(break_duration)
+        self.time_on_breaks += break_duration  # own duration, a later call may have started another break meanwhile
+
+
+ISSUE_TYPES = ('normal', 'medium', 'complicated')
+ISSUE_CODES = {issue_type: code for code, issue_type in enumerate(ISSUE_TYPES)}
+NORMAL, MEDIUM, COMPLICATED = range(len(ISSUE_TYPES))
+HISTORY_BITS = 8  # bits per issue code in Client.history, networks have at most 2 ** HISTORY_BITS classes
+INITIAL_PRIORITY = (1, 5, 10)  # by issue code, higher priority to clients with more complicated problem at start
+
+# Departments in order of Route.departments
+PS_DEPARTMENT, FIFO_DEPARTMENT, LIFOPR_DEPARTMENT = range(3)
+QUIT = -1
+
+# Routing actions
+CONVERT_TO_COMPLICATED, CONVERT_TO_MEDIUM, CONVERT_TO_NORMAL, STAY_COMPLICATED, STAY_MEDIUM, QUIT_SYSTEM = range(6)
+
+# action: (new issue code or None, added to issue history, priority increase, next department)
+ACTIONS = (
+    (COMPLICATED, True, 5, LIFOPR_DEPARTMENT),  # increasing priority for tickets being longer in system in case they end up in lifopr
+    (MEDIUM, True, 5, FIFO_DEPARTMENT),
+    (NORMAL, True, 5, PS_DEPARTMENT),
+    (None, False, 0, LIFOPR_DEPARTMENT),
+    (MEDIUM, False, 0, FIFO_DEPARTMENT),
+    (None, False, 0, QUIT)
+)
+
+# Possible actions in order of the probabilities given for a department (and issue type in PS)
+PS_OUTCOMES = {
+    'normal': (CONVERT_TO_COMPLICATED, CONVERT_TO_MEDIUM, QUIT_SYSTEM),
+    'medium': (STAY_MEDIUM, CONVERT_TO_COMPLICATED),
+    'complicated': (STAY_COMPLICATED, CONVERT_TO_MEDIUM)
+}
+FIFO_OUTCOMES = (CONVERT_TO_COMPLICATED, CONVERT_TO_NORMAL, QUIT_SYSTEM)
+LIFOPR_OUTCOMES = (CONVERT_TO_MEDIUM, QUIT_SYSTEM)
+
+
+def compile_routing_table(outcomes, probabilities):
+    """Turn per issue type probabilities into (cumulative probabilities, actions) rows indexed by issue code.
+
+    Missing probabilities mean every outcome is equally likely, issue types without outcomes get None.
+    """
+    table = []
+    for issue_type in ISSUE_TYPES:
+        actions = outcomes.get(issue_type) if isinstance(outcomes, dict) else outcomes
+        if actions is None:
+            table.append(None)
+            continue
+        weights = probabilities.get(issue_type) or [1] * len(actions)
+        if len(weights) != len(actions):
+            raise ValueError(f"{len(weights)} routing probabilities for {len(actions)} outcomes of issue type {issue_type!r}")
+        cumulative = list(accumulate(weights))
+        cumulative = [value / cumulative[-1] for value in cumulative]
+        cumulative[-1] = 1.0  # uniform draws are < 1, the scan always stops
+        table.append((tuple(cumulative), tuple(actions)))
+    return table
 
 
 class Route:
-    def __init__(self, ps_department, fifo_department, lifopr_department):
+    def __init__(self, ps_department, fifo_department, lifopr_department, context=None):
         self.ps_department = ps_department
         self.fifo_department = fifo_department
         self.lifopr_department = lifopr_department
+        self.departments = (ps_department, fifo_department, lifopr_department)
+        self.department_codes = {department.department_name: code for code, department in enumerate(self.departments)}
+
+        self.context = context if context is not None else ps_department.context
+        self.log = self.context.log
+        self.log_arrivals = self.log.enabled(ARRIVAL)
+        self.log_exits = self.log.enabled(EXIT)
+        self.class_uniforms = self.context.streams.uniform('arrival_class')
+        self.routing_uniforms = [self.context.streams.uniform(f'routing/{department.department_name}') for department in self.departments]
 
         self.ps_propabilites = {}
         self.fifo_propabilites = {}
         self.lifopr_propabilites = {}
+        self.routing_table = [[None] * len(ISSUE_TYPES) for _ in self.departments]  # [department][issue code]
 
     def _fill_propabilities(self, ps_prop, fifo_prop, lifopr_prop):
-        """Filling propabilites for routes in the system."""
+        """Filling propabilites for routes in the system and compiling them into the routing table."""
         self.ps_propabilites = ps_prop
         self.fifo_propabilites = fifo_prop
         self.lifopr_propabilites = lifopr_prop
+        self.routing_table = [
+            compile_routing_table(PS_OUTCOMES, ps_prop),
+            compile_routing_table(FIFO_OUTCOMES, fifo_prop),
+            compile_routing_table(LIFOPR_OUTCOMES, lifopr_prop)
+        ]
+
+    def _arrival_class(self):
+        """Issue code of a new client, every issue type is equally likely."""
+        return int(self.class_uniforms.next() * len(ISSUE_TYPES))
 
     def _first_arrival(self, client):
-        """Route new clients to the FIFO department."""
-        if client.issue_type == 'complicated': # addressing higher priority to clients with more complicated problem at start
-            client.priority = 10
-        elif client.issue_type == 'medium':
-            client.priority = 5
-        elif client.issue_type == 'normal':
-            client.priority = 1
+        """Route new clients to the PS department."""
+        client.priority = INITIAL_PRIORITY[client.issue_code]
 
         client.current_department = self.ps_department.department_name
         self.ps_department._add_client(client)
 
     def _route_client(self, client):
         """Reroute clients based on their issue type and current department."""
-        current_department = client.current_department
-
-        if current_department == 'ps':
-            probabilities = self.ps_propabilites.get(client.issue_type)
-            if client.issue_type == 'normal':
-                outcomes = ['convert_to_complicated', 'convert_to_medium', 'quit_system']
-                action = random.choices(outcomes, weights=probabilities, k=1)[0]
-                self._process_action(client, action)
-            elif client.issue_type == 'medium':
-                outcomes = ['stay_medium', 'convert_to_complicated']
-                action = random.choices(outcomes, weights=probabilities, k=1)[0]
-                self._process_action(client, action)
-            elif client.issue_type == 'complicated':
-                outcomes = ['stay_complicated', 'convert_to_medium']
-                action = random.choices(outcomes, weights=probabilities, k=1)[0]
-                self._process_action(client, action)
-
-        elif current_department == 'fifo':
-                probabilities = self.fifo_propabilites.get(client.issue_type)
-                outcomes = ['convert_to_complicated', 'convert_to_normal', 'quit_system']
-                action = random.choices(outcomes, weights=probabilities, k=1)[0]
-                self._process_action(client, action)
-
-        elif current_department == 'lifopr':
-            probabilities = self.lifopr_propabilites.get(client.issue_type)
-            outcomes = ['convert_to_medium', 'quit_system']
-            action = random.choices(outcomes, weights=probabilities, k=1)[0]
-            self._process_action(client, action)
-
-        # Add a small timeout to make this function a generator
-        yield self.ps_department.env.timeout(0)
-        yield self.fifo_department.env.timeout(0)
-        yield self.lifopr_department.env.timeout(0)
+        code = self.department_codes[client.current_department]
+        row = self.routing_table[code][client.issue_code]
+        if row is None:
+            return
+        cumulative, actions = row
+        draw = self.routing_uniforms[code].next()
+        index = 0
+        while draw >= cumulative[index]:
+            index += 1
+        self._process_action(client, actions[index])
 
     def _process_action(self, client, action):
         """Process the selected action based on probabilities."""
-        if action == 'convert_to_complicated':
-            client.issue_type = 'complicated'
-            client.issue_history.append('complicated') #keep track of client visits
-            client.priority += 5 # increasing priority for tickets being longer in system in case they end up in lifopr
-            self.lifopr_department._add_client(client)
-        elif action == 'convert_to_medium':
-            client.issue_type = 'medium'
-            client.issue_history.append('medium')
-            client.priority += 5
-            self.fifo_department._add_client(client)
-        elif action == 'convert_to_normal':
-            client.priority += 5
-            client.issue_type = 'normal'
-            client.issue_history.append('normal')
-            self.ps_department._add_client(client)
-        elif action == 'stay_complicated':
-            self.lifopr_department._add_client(client)
-        elif action == 'stay_medium':
-            client.issue_type = 'medium'
-            self.fifo_department._add_client(client)
-        elif action == 'quit_system':
-            print(f"Client {client.client_id} processed succesfully! Client history: {client.issue_history}")
-
-def client_arrival(env, client_id, route, logging=False):
-    """Simulate client arrival and routing."""
-    issue_types = ['normal', 'medium', 'complicated']
-    issue_type = random.choice(issue_types)
-    client = Client(client_id, issue_type, env.now)
-    client.issue_history.append(issue_type)
-    all_clients.append(client)
-
-    if logging:
-        print(f"Client {client_id} arrives with a {issue_type} issue at time {env.now:.2f}.")
-
-    route._first_arrival(client)
-
-    yield env.timeout(0)
-
-def generate_clients(env, num_clients, arrival_rate, route, logging=False):
-    """Generate clients over time based on arrival rate."""
-    for client_id in range(1, num_clients + 1):
-        env.process(client_arrival(env, client_id, route, logging=logging))
-        yield env.timeout(arrival_rate)
-
-
-
+        issue_code, record_history, priority_increase, department = ACTIONS[action]
+        if issue_code is not None:
+            client.issue_code = issue_code
+            if record_history:
+                client._record_issue(issue_code) #keep track of client visits
+        client.priority += priority_increase
+        if department == QUIT:
+            if self.log_exits:
+                self.log.write("Client %s processed succesfully! Client history: %s", client.client_id, client.issue_history)
+            self.context._client_exited(client)
+            return
+        self.departments[department]._add_client(client)
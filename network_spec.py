@@ -0,0 +1,220 @@
+"""Networks with any number of stations and client classes, described by data.
+
+A NetworkSpec lists stations (discipline, consultants, service distribution of every class), the
+entry of new clients and a sparse class-switching routing matrix given as transitions
+
+    {'from': (station, class), 'to': (station, class) or None for leaving, 'p': probability,
+     'priority': priority increase (optional, 0 by default)}
+
+build_network compiles it into the departments of network.py and a MatrixRoute. Every row of the
+routing matrix, i.e. every (station, class) pair, becomes a Walker alias table indexed by station
+and class code, so routing a client takes one uniform draw and O(1) work, whatever the number of
+stations, classes and outcomes. The classic three-department model is three_department_spec().
+"""
+from collections import namedtuple
+
+from network import (DepartmentPS, DepartmentFIFO, DepartmentLIFOPR, SimulationContext, ACTIONS, PS_OUTCOMES,
+                     FIFO_OUTCOMES, LIFOPR_OUTCOMES, QUIT, INITIAL_PRIORITY, ISSUE_TYPES, HISTORY_BITS,
+                     compile_routing_table)
+from simulation_log import ARRIVAL, EXIT
+
+DISCIPLINES = {
+    'ps': DepartmentPS,
+    'fifo': DepartmentFIFO,
+    'lifopr': DepartmentLIFOPR
+}
+
+# service: {class: rate} for fifo / lifopr, {class: {'phases', 'rates', 'weights'}} (Cox) for ps.
+# preemptive only matters for lifopr.
+StationSpec = namedtuple('StationSpec', 'name discipline servers service preemptive', defaults=(False,))
+
+# classes: names of the client classes, entry: {class: {'weight', 'station', 'priority'}} of new clients
+NetworkSpec = namedtuple('NetworkSpec', 'stations classes entry routing')
+
+
+def alias_table(weights):
+    """Walker alias table (probabilities, aliases) of a discrete distribution (Vose's method)."""
+    total = float(sum(weights))
+    size = len(weights)
+    scaled = [weight * size / total for weight in weights]
+    probabilities = [1.0] * size
+    aliases = list(range(size))
+    small = [index for index, value in enumerate(scaled) if value < 1]
+    large = [index for index, value in enumerate(scaled) if value >= 1]
+    while small and large:
+        low, high = small.pop(), large.pop()
+        probabilities[low] = scaled[low]
+        aliases[low] = high
+        scaled[high] -= 1 - scaled[low]
+        (small if scaled[high] < 1 else large).append(high)
+    return tuple(probabilities), tuple(aliases)
+
+
+def alias_draw(row, uniform):
+    """Outcome of an alias table row for a uniform number in [0, 1)."""
+    probabilities, aliases, outcomes = row
+    scaled = uniform * len(outcomes)
+    index = int(scaled)
+    return outcomes[index] if scaled - index < probabilities[index] else outcomes[aliases[index]]
+
+
+def validate_spec(spec):
+    stations = {station.name for station in spec.stations}
+    if len(stations) != len(spec.stations):
+        raise ValueError("station names have to be unique")
+    if len(set(spec.classes)) != len(spec.classes):
+        raise ValueError("class names have to be unique")
+    if len(spec.classes) > 1 << HISTORY_BITS:
+        raise ValueError(f"at most {1 << HISTORY_BITS} classes are supported")
+    for station in spec.stations:
+        if station.discipline not in DISCIPLINES:
+            raise ValueError(f"station {station.name!r}: unknown discipline {station.discipline!r}")
+    for name, entry in spec.entry.items():
+        if name not in spec.classes or entry['station'] not in stations:
+            raise ValueError(f"entry of class {name!r} refers to an unknown class or station")
+    for transition in spec.routing:
+        targets = [transition['from']] + ([transition['to']] if transition['to'] is not None else [])
+        for station, class_name in targets:
+            if station not in stations or class_name not in spec.classes:
+                raise ValueError(f"transition {transition} refers to an unknown station or class")
+        if transition['p'] < 0:
+            raise ValueError(f"transition {transition} has a negative probability")
+
+
+def compile_routing_matrix(spec):
+    """Alias table rows [station index][class code] of the routing matrix, None for rows without transitions.
+
+    Outcomes are (class code, station index or QUIT, priority increase). Probabilities of a row are
+    normalised to sum up to 1, so exits have to be listed as transitions to None.
+    """
+    station_codes = {station.name: code for code, station in enumerate(spec.stations)}
+    class_codes = {name: code for code, name in enumerate(spec.classes)}
+    rows = {}
+    for transition in spec.routing:
+        if transition['p'] == 0:
+            continue
+        station, class_name = transition['from']
+        if transition['to'] is None:
+            outcome = (class_codes[class_name], QUIT, transition.get('priority', 0))
+        else:
+            target_station, target_class = transition['to']
+            outcome = (class_codes[target_class], station_codes[target_station], transition.get('priority', 0))
+        rows.setdefault((station_codes[station], class_codes[class_name]), []).append((outcome, transition['p']))
+
+    matrix = [[None] * len(spec.classes) for _ in spec.stations]
+    for (station, class_code), entries in rows.items():
+        outcomes = tuple(outcome for outcome, _ in entries)
+        probabilities, aliases = alias_table([probability for _, probability in entries])
+        matrix[station][class_code] = (probabilities, aliases, outcomes)
+    return matrix
+
+
+class MatrixRoute:
+    """Route of a generic network, moves clients according to a compiled routing matrix.
+
+    Offers the same interface to departments and client generators as Route.
+    """
+    def __init__(self, departments, spec, context):
+        self.departments = tuple(departments)
+        self.department_codes = {department.department_name: code for code, department in enumerate(self.departments)}
+        self.context = context
+        self.log = context.log
+        self.log_arrivals = self.log.enabled(ARRIVAL)
+        self.log_exits = self.log.enabled(EXIT)
+        self.class_uniforms = context.streams.uniform('arrival_class')
+        self.routing_uniforms = [context.streams.uniform(f'routing/{department.department_name}') for department in self.departments]
+        self.routing_matrix = compile_routing_matrix(spec)
+
+        class_codes = {name: code for code, name in enumerate(spec.classes)}
+        entries = [(class_codes[name], entry) for name, entry in spec.entry.items()]
+        probabilities, aliases = alias_table([entry.get('weight', 1) for _, entry in entries])
+        self.entry_row = (probabilities, aliases, tuple(code for code, _ in entries))
+        self.entry_station = [None] * len(spec.classes)
+        self.entry_priority = [0] * len(spec.classes)
+        for code, entry in entries:
+            self.entry_station[code] = self.department_codes[entry['station']]
+            self.entry_priority[code] = entry.get('priority', 0)
+
+    def _arrival_class(self):
+        return alias_draw(self.entry_row, self.class_uniforms.next())
+
+    def _first_arrival(self, client):
+        """Send a new client to the entry station of its class."""
+        client.priority = self.entry_priority[client.issue_code]
+        self.departments[self.entry_station[client.issue_code]]._add_client(client)
+
+    def _route_client(self, client):
+        """Move a client that finished service at its current station."""
+        code = self.department_codes[client.current_department]
+        row = self.routing_matrix[code][client.issue_code]
+        if row is None:  # no transition defined, the client leaves
+            self._leave(client)
+            return
+        issue_code, station, priority_increase = alias_draw(row, self.routing_uniforms[code].next())
+        if issue_code != client.issue_code:
+            client.issue_code = issue_code
+            client._record_issue(issue_code)
+        client.priority += priority_increase
+        if station == QUIT:
+            self._leave(client)
+            return
+        self.departments[station]._add_client(client)
+
+    def _leave(self, client):
+        if self.log_exits:
+            self.log.write("Client %s processed succesfully! Client history: %s", client.client_id,
+                           [self.context.classes[code] for code in client.history_codes()])
+        self.context._client_exited(client)
+
+
+def build_network(env, spec, context=None):
+    """Departments and MatrixRoute of a network spec, ready to process clients."""
+    validate_spec(spec)
+    context = context if context is not None else SimulationContext(env)
+    context.classes = tuple(spec.classes)
+
+    departments = []
+    for station in spec.stations:
+        if station.discipline == 'lifopr':
+            department = DepartmentLIFOPR(env, station.name, preemptive=station.preemptive, context=context)
+        else:
+            department = DISCIPLINES[station.discipline](env, station.name, context=context)
+        department._fill_processing_time(station.service)
+        department._create_consultants(station.servers)
+        departments.append(department)
+
+    route = MatrixRoute(departments, spec, context)
+    for department in departments:
+        department._init_route(route)
+        env.process(department._process_clients())
+    return departments, route
+
+
+def three_department_spec(ps_pt, fifo_pt, lifopr_pt, ps_co, fifo_co, lifopr_co, ps_prob, fifo_prob, lifopr_prob,
+                          lifopr_preemptive=False):
+    """The PS / FIFO / LIFOPR network of run_simulation written as a NetworkSpec."""
+    stations = (
+        StationSpec('ps', 'ps', ps_co, ps_pt),
+        StationSpec('fifo', 'fifo', fifo_co, fifo_pt),
+        StationSpec('lifopr', 'lifopr', lifopr_co, lifopr_pt, lifopr_preemptive)
+    )
+    tables = (
+        compile_routing_table(PS_OUTCOMES, ps_prob),
+        compile_routing_table(FIFO_OUTCOMES, fifo_prob),
+        compile_routing_table(LIFOPR_OUTCOMES, lifopr_prob)
+    )
+    routing = []
+    for station, table in zip(stations, tables):
+        for class_code, row in enumerate(table):
+            if row is None:
+                continue
+            cumulative, actions = row
+            for probability, action in zip((c - p for c, p in zip(cumulative, (0,) + cumulative[:-1])), actions):
+                issue_code, _, priority_increase, department = ACTIONS[action]
+                issue_code = class_code if issue_code is None else issue_code
+                target = None if department == QUIT else (stations[department].name, ISSUE_TYPES[issue_code])
+                routing.append({'from': (station.name, ISSUE_TYPES[class_code]), 'to': target,
+                                'p': probability, 'priority': priority_increase})
+
+    entry = {name: {'weight': 1, 'station': 'ps', 'priority': INITIAL_PRIORITY[code]} for code, name in enumerate(ISSUE_TYPES)}
+    return NetworkSpec(stations, ISSUE_TYPES, entry, routing)
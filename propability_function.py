@@ -1,8 +1,125 @@
+from functools import lru_cache
 from simulation import *
 import numpy as np
 
-def compute_propability_of_state(ps_values, ps_values_medium, ps_values_comp, fifo_values, lifopr_values, service_rates, arrival_rate, given_state, ps_processing_time_values):
-    """Function to calculate state propability."""
+STATIONS = ('ps', 'fifo', 'lifopr')
+PS_ISSUE_TYPES = ('normal', 'medium', 'complicated')
+
+
+def calculate_effective_service_rate(phases, rates, weights):
+    """Function to calculate effective service rate based on COX distribution."""
+    expected_service_time = sum(weight / rate for weight, rate in zip(weights, rates))
+    effective_service_rate = 1 / expected_service_time
+    return effective_service_rate
+
+
+def _log_factorial(n):
+    """log(n!) of a non-negative integer array."""
+    n = np.asarray(n, dtype=int)
+    table = np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, max(int(n.max(initial=0)), 0) + 1)))))
+    return table[n]
+
+
+def _log_empty_probability(loads, servers):
+    """log pi(0) of a station served with rate mu * min(n, servers), nan when the station is overloaded.
+
+    Covers c-server FIFO/LIFOPR stations (M/M/c) as well as load-dependent PS stations, they share the
+    marginal distribution. The normalisation sum is evaluated in log space (log-sum-exp), so large loads
+    and server counts do not overflow. Arrays of loads and servers broadcast together.
+    """
+    loads, servers = np.broadcast_arrays(np.asarray(loads, dtype=float), np.asarray(servers, dtype=int))
+    clients = np.arange(int(servers.max(initial=1)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_loads = np.log(loads)
+        terms = np.where(clients == 0, 0.0, clients * log_loads[..., None]) - _log_factorial(clients)
+        terms = np.where(clients < servers[..., None], terms, -np.inf)
+        tail = servers * log_loads - _log_factorial(servers) - np.log1p(-loads / servers)
+        terms = np.concatenate([terms, tail[..., None]], axis=-1)
+        largest = terms.max(axis=-1)
+        log_norm = largest + np.log(np.exp(terms - largest[..., None]).sum(axis=-1))
+        return np.where(loads < servers, -log_norm, np.nan)
+
+
+def _log_state_probability(clients, loads, servers, log_empty):
+    """log pi(n) of a multi-server station for arrays of client counts."""
+    clients = np.asarray(clients, dtype=int)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_weight = np.where(clients <= servers, _log_factorial(clients),
+                              _log_factorial(servers) + (clients - servers) * np.log(servers))
+        return log_empty + np.where(clients == 0, 0.0, clients * np.log(loads)) - log_weight
+
+
+def erlang_c(loads, servers):
+    """Probability that a client has to wait at an M/M/c station with offered load loads (Erlang C)."""
+    servers = np.asarray(servers, dtype=int)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_wait = (servers * np.log(loads) - _log_factorial(servers) - np.log1p(-np.asarray(loads) / servers)
+                    + _log_empty_probability(loads, servers))
+        return np.exp(log_wait)
+
+
+def mean_clients(loads, servers):
+    """Mean number of clients at a multi-server station, inf when it is overloaded."""
+    utilisation = np.asarray(loads, dtype=float) / servers
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(utilisation < 1, erlang_c(loads, servers) * utilisation / (1 - utilisation) + loads, np.inf)
+
+
+def _freeze(value):
+    """Hashable copy of nested parameter lists and dicts, used as the cache key."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    return value
+
+
+class ProductFormSolution:
+    """Solved traffic equations of the network for one parameter set.
+
+    Stations are ordered as in STATIONS (PS, FIFO, LIFOPR), station i has servers[i] consultants. The
+    stationary distribution is the BCMP product of multi-server marginals, for single servers
+    pi(n) = prod_i (1 - p_i) * p_i ** n_i. Every method works on whole arrays of states at once.
+    Probabilities of overloaded stations (p_i >= servers[i]) are nan.
+    """
+    def __init__(self, visit_ratios, loads, throughputs, servers=(1, 1, 1)):
+        self.visit_ratios = visit_ratios  # e_11, e_12, e_13, e_22, e_33
+        self.loads = loads  # p_1, p_2, p_3, offered load of every station
+        self.throughputs = throughputs  # arrival rate at every station
+        self.servers = np.asarray(servers, dtype=int)
+        self.utilisations = loads / self.servers
+        self.stable = bool(np.all(self.utilisations < 1))
+        self._log_empty = _log_empty_probability(loads, self.servers)
+
+    def state_probabilities(self, states):
+        """Probabilities of (PS, FIFO, LIFO) states, states has shape (..., 3)."""
+        log_probabilities = _log_state_probability(states, self.loads, self.servers, self._log_empty)
+        probabilities = np.exp(log_probabilities.sum(axis=-1))
+        return probabilities if probabilities.ndim else float(probabilities)
+
+    def marginals(self, max_clients):
+        """Marginal distributions truncated to 0..max_clients clients, shape (3, max_clients + 1)."""
+        clients = np.arange(max_clients + 1)
+        return np.exp(_log_state_probability(clients, self.loads[:, None], self.servers[:, None], self._log_empty[:, None]))
+
+    def waiting_probabilities(self):
+        """Probability that a client arriving at every station finds all consultants busy (Erlang C)."""
+        return erlang_c(self.loads, self.servers)
+
+    def mean_queue_lengths(self):
+        """Mean number of clients at every station, inf for overloaded stations."""
+        return mean_clients(self.loads, self.servers)
+
+    def response_times(self):
+        """Mean time spent at every station per visit (Little's law)."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.mean_queue_lengths() / self.throughputs
+
+
+@lru_cache(maxsize=256)
+def _solve_traffic_equations(ps_values, ps_values_medium, ps_values_comp, fifo_values, lifopr_values, service_rates, arrival_rate, ps_processing_time_items, servers):
     P_0_11 = P_0_12 = P_0_13 = 1
     P_11_33, P_11_22, P_11_0 = ps_values
     P_12_22, P_12_33 = ps_values_medium
@@ -12,13 +129,8 @@ def compute_propability_of_state(ps_values, ps_values_medium, ps_values_comp, fi
 
     P_33_22, P_33_0 = lifopr_values
 
-    def calculate_effective_service_rate(phases, rates, weights):
-        """Function to calculate effective service rate based on COX distribution."""
-        expected_service_time = sum(weight / rate for weight, rate in zip(weights, rates))
-        effective_service_rate = 1 / expected_service_time
-        return effective_service_rate
-
-    #calculating based on COX distribution    
+    #calculating based on COX distribution
+    ps_processing_time_values = {key: dict(params) for key, params in ps_processing_time_items}
     ps_normal = ps_processing_time_values['normal']
     ps_medium = ps_processing_time_values['medium']
     ps_complicated = ps_processing_time_values['complicated']
@@ -53,11 +165,93 @@ def compute_propability_of_state(ps_values, ps_values_medium, ps_values_comp, fi
 
     p_1 = arrival_rate * e_11 / mu_11 + arrival_rate * e_12 / mu_12 + arrival_rate * e_13 / mu_13
     p_2 = arrival_rate * e_22 / mu_22
-    p_3 = arrival_rate * e_33 / mu_33 
+    p_3 = arrival_rate * e_33 / mu_33
+
+    loads = np.array([p_1, p_2, p_3])
+    throughputs = arrival_rate * np.array([e_11 + e_12 + e_13, e_22, e_33])
+    loads.flags.writeable = False  # shared by every caller of the cache
+    throughputs.flags.writeable = False
+    e_values.flags.writeable = False
+    return ProductFormSolution(e_values, loads, throughputs, [int(c) for c in servers])
+
+
+def solve_product_form(ps_values, ps_values_medium, ps_values_comp, fifo_values, lifopr_values, service_rates, arrival_rate, ps_processing_time_values, servers=(1, 1, 1)):
+    """Solve the traffic equations once per parameter set, repeated calls are served from a cache.
+
+    servers gives the number of consultants at PS, FIFO and LIFOPR.
+    """
+    return _solve_traffic_equations(
+        _freeze(ps_values), _freeze(ps_values_medium), _freeze(ps_values_comp),
+        _freeze(fifo_values), _freeze(lifopr_values), _freeze(service_rates),
+        _freeze(arrival_rate), _freeze(ps_processing_time_values), _freeze(servers)
+    )
+
+
+def compute_propability_of_state(ps_values, ps_values_medium, ps_values_comp, fifo_values, lifopr_values, service_rates, arrival_rate, given_state, ps_processing_time_values, servers=(1, 1, 1)):
+    """Function to calculate state propability."""
+    solution = solve_product_form(ps_values, ps_values_medium, ps_values_comp, fifo_values, lifopr_values,
+                                  service_rates, arrival_rate, ps_processing_time_values, servers)
+    return solution.state_probabilities(given_state)
+
+
+def sweep_product_form(ps_values, ps_values_medium, ps_values_comp, fifo_values, lifopr_values, service_rates, arrival_rate, ps_processing_time_values, servers=(1, 1, 1)):
+    """Solve the product-form model for a whole grid of parameter sets at once.
+
+    Arguments have the same shape as for compute_propability_of_state, but every scalar (a routing
+    probability, a service rate or the arrival rate inside [arrival_rate]) may be a NumPy array. All of
+    them are broadcast together and the traffic equations of every point are solved by one stacked
+    np.linalg.solve. ps_processing_time_values is either the Cox parameter dict or a sequence of the
+    three effective PS rates (normal, medium, complicated), which may be arrays as well. servers holds
+    the consultant counts of PS, FIFO and LIFOPR, again scalars or arrays.
+
+    Returns a dict of arrays with the broadcast shape S: 'visit_ratios' (S, 5), 'loads' (S, 3),
+    'utilisations' (S, 3), 'throughputs' (S, 3), 'stable' (S), 'waiting_probabilities' (S, 3) and
+    'mean_queue_lengths' (S, 3) with inf for overloaded stations.
+    """
+    if isinstance(ps_processing_time_values, dict):
+        ps_rates = [calculate_effective_service_rate(**ps_processing_time_values[key]) for key in PS_ISSUE_TYPES]
+    else:
+        ps_rates = list(ps_processing_time_values)
+
+    P_11_33, P_11_22, _ = ps_values
+    P_12_22, P_12_33 = ps_values_medium
+    P_13_33, P_13_22 = ps_values_comp
+    P_22_33, P_22_11, _ = fifo_values
+    P_33_22, _ = lifopr_values
+
+    (P_11_33, P_11_22, P_12_22, P_12_33, P_13_33, P_13_22, P_22_33, P_22_11, P_33_22,
+     mu_11, mu_12, mu_13, mu_22, mu_33, arrival) = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (
+            P_11_33, P_11_22, P_12_22, P_12_33, P_13_33, P_13_22, P_22_33, P_22_11, P_33_22,
+            *ps_rates, *service_rates, arrival_rate[0])))
+    shape = arrival.shape
+
+    A = np.zeros(shape + (5, 5))
+    A[..., [0, 1, 2, 3, 4], [0, 1, 2, 3, 4]] = 1
+    A[..., 0, 3] = -P_22_11
+    A[..., 3, 0], A[..., 3, 1], A[..., 3, 2], A[..., 3, 4] = -P_11_22, -P_12_22, -P_13_22, -P_33_22
+    A[..., 4, 0], A[..., 4, 1], A[..., 4, 2], A[..., 4, 3] = -P_11_33, -P_12_33, -P_13_33, -P_22_33
+    b = np.zeros(shape + (5, 1))
+    b[..., :3, 0] = 1  # P_0_11 = P_0_12 = P_0_13 = 1
+
+    e_values = np.linalg.solve(A, b)[..., 0]
+    e_11, e_12, e_13, e_22, e_33 = np.moveaxis(e_values, -1, 0)
 
-    pi_1 = (1-p_1) * (p_1 ** given_state[0])
-    pi_2 = (1-p_2) * (p_2 ** given_state[1])
-    pi_3 = (1-p_3) * (p_3 ** given_state[2])
+    loads = np.stack([
+        arrival * e_11 * mu_11 + arrival * e_12 * mu_12 + arrival * e_13 * mu_13,
+        arrival * e_22 * mu_22,
+        arrival * e_33 * mu_33
+    ], axis=-1)
+    throughputs = arrival[..., None] * np.stack([e_11 + e_12 + e_13, e_22, e_33], axis=-1)
+    servers = np.broadcast_to(np.stack(np.broadcast_arrays(*(np.asarray(c, dtype=int) for c in servers)), axis=-1), loads.shape)
+    utilisations = loads / servers
 
-    state_propability = pi_1 * pi_2 * pi_3
-    return state_propability
\ No newline at end of file
+    return {
+        'visit_ratios': e_values,
+        'loads': loads,
+        'utilisations': utilisations,
+        'throughputs': throughputs,
+        'stable': np.all(utilisations < 1, axis=-1),
+        'waiting_probabilities': erlang_c(loads, servers),
+        'mean_queue_lengths': mean_clients(loads, servers)
+    }
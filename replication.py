@@ -0,0 +1,71 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from analytics import time_weighted_mean
+from estimation import confidence_interval
+from simulation import run_simulation, DEFAULT_SCENARIO
+
+DEPARTMENTS = ('ps', 'fifo', 'lifopr')
+
+
+def summarize_run(result):
+    """Reduce the output of run_simulation to a flat dictionary of scalar metrics."""
+    fifo_results, lifopr_results, ps_results, (lifo_wait, fifo_wait), averages = result
+    metrics = {
+        'lifopr_mean_wait': lifo_wait,
+        'fifo_mean_wait': fifo_wait,
+    }
+    for name, results in zip(DEPARTMENTS, (ps_results, fifo_results, lifopr_results)):
+        metrics[f'{name}_mean_queue'] = time_weighted_mean(results.queue_change_time, results.queue_size)
+        metrics[f'{name}_processed'] = results.processed_clients[-1]
+        metrics[f'{name}_avg_call_time'] = averages[name]['avg_call_time']
+        metrics[f'{name}_avg_break_time'] = averages[name]['avg_break_time']
+    return metrics
+
+
+def summarize_replications(runs, confidence=0.95):
+    """Combine metrics of independent replications into means and confidence intervals."""
+    summary = {}
+    for metric in runs[0]:
+        mean, std, half_width = confidence_interval([run[metric] for run in runs], confidence)
+        summary[metric] = {
+            'mean': mean,
+            'std': std,
+            'half_width': half_width,
+            'ci': (mean - half_width, mean + half_width),
+            'n': len(runs)
+        }
+    return summary
+
+
+def _run_replication(task, metrics=summarize_run):
+    scenario, seed = task
+    return metrics(run_simulation(**scenario, seed=seed))
+
+
+def run_replications(scenario=None, replications=10, seed=None, processes=None, confidence=0.95):
+    """Run independent replications of one scenario across a process pool.
+
+    scenario holds keyword arguments of run_simulation (DEFAULT_SCENARIO when not given). Every
+    replication gets its own child of numpy SeedSequence(seed), so streams never overlap and the
+    whole experiment is reproducible from a single seed. With processes=1 everything runs in this process.
+    Returns {metric: {'mean', 'std', 'half_width', 'ci', 'n'}} together with the per replication metrics.
+    """
+    scenario = dict(DEFAULT_SCENARIO if scenario is None else scenario)
+    seeds = np.random.SeedSequence(seed).spawn(replications)
+    runs = run_tasks([(scenario, child) for child in seeds], processes)
+    return summarize_replications(runs, confidence), runs
+
+
+def run_tasks(tasks, processes=None, metrics=summarize_run):
+    """Metrics of (scenario, seed) tasks in task order, processes=1 runs them in this process.
+
+    metrics reduces the output of run_simulation to the metrics of one run, a module-level function
+    so that worker processes can unpickle it. Tasks go to the workers in chunks, about four per worker.
+    """
+    run = partial(_run_replication, metrics=metrics)
+    if processes == 1:
+        return [run(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(run, tasks, chunksize=max(len(tasks) // (4 * (processes or os.cpu_count() or 1)), 1)))
@@ -0,0 +1,187 @@
+"""Content-addressed on-disk cache of simulation and product-form results.
+
+Keys are SHA-256 hashes of a canonical JSON form of every parameter, the seed and a hash of the
+source code of the model, so changing the code never returns stale results. Values are pickled,
+zlib-compressed files named after their key. Reading a file marks it as recently used; when the
+cache grows above max_bytes the least recently used files are removed.
+
+Only reproducible calls are cached: run_simulation needs a seed, and runs writing a log, taking
+a progress callback or an own environment or using a stopping rule or arrival process object always run.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import zlib
+
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.result_cache')
+MAX_BYTES = 512 * 1024 * 1024
+COMPRESSION_LEVEL = 1
+
+# Modules whose source defines the results, part of every key
+MODEL_SOURCES = ('network.py', 'network_spec.py', 'fast_engine.py', 'arrivals.py', 'simulation.py', 'sampling.py',
+                 'stopping.py', 'streaming.py', 'simulation_log.py', 'estimation.py', 'propability_function.py')
+
+_code_version = None
+
+
+def code_version():
+    """Hash of the model source files, computed once per process."""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in MODEL_SOURCES:
+            with open(os.path.join(directory, name), 'rb') as source:
+                digest.update(name.encode() + b'\0' + source.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def _canonical(value):
+    """JSON-compatible form of a parameter, equal parameters always give equal forms."""
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return [_canonical(item) for item in value.tolist()]
+    if isinstance(value, np.random.SeedSequence):
+        return {'entropy': _canonical(value.entropy), 'spawn_key': _canonical(value.spawn_key)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float):
+        return repr(value)  # exact, 0.1 and 0.1000000001 stay different
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    raise TypeError(f"cannot build a cache key from {type(value).__name__}")
+
+
+def cache_key(kind, parameters):
+    """Key of a call of kind (e.g. 'simulation') with the given parameters."""
+    text = json.dumps({'kind': kind, 'code': code_version(), 'parameters': _canonical(parameters)},
+                      sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    """Directory of compressed pickled results with least recently used eviction."""
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # bytes on disk, scanned on the first write
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pkl.z')
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cached:
+                value = pickle.loads(zlib.decompress(cached.read()))
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            self.misses += 1  # damaged file, computed again and overwritten
+            return default
+        try:
+            os.utime(path)  # most recently used
+        except OSError:
+            pass  # evicted by another process since it was read, the value is still good
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), COMPRESSION_LEVEL)
+        # written next to the target and renamed, readers never see half a file
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as cached:
+            cached.write(data)
+        os.replace(temporary, path)
+        if self._size is None:
+            self._size = self.size
+        else:
+            self._size += len(data)  # overwritten files are counted twice until the next scan
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for folder, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.pkl.z'):
+                    path = os.path.join(folder, name)
+                    try:
+                        status = os.stat(path)
+                    except FileNotFoundError:  # removed by another process
+                        continue
+                    entries.append((status.st_mtime, status.st_size, path))
+        return entries
+
+    @property
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove least recently used results until the cache fits into max_bytes."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def clear(self):
+        for _, _, path in self._entries():
+            os.remove(path)
+        self._size = 0
+
+
+def simulation_key(scenario):
+    """Cache key of run_simulation(**scenario), None when the run is not reproducible."""
+    if scenario.get('seed') is None or scenario.get('log_levels') or scenario.get('env') is not None \
+            or scenario.get('progress') is not None or not isinstance(scenario.get('stop', ''), str) \
+            or not isinstance(scenario.get('arrivals', ''), (str, dict)):
+        return None
+    return cache_key('simulation', {name: value for name, value in scenario.items() if name != 'log_sink'})
+
+
+def cached_run_simulation(cache=None, **scenario):
+    """run_simulation(**scenario) served from the cache when the same run was done before."""
+    from simulation import run_simulation
+
+    key = simulation_key(scenario)
+    if key is None:
+        return run_simulation(**scenario)
+    cache = cache if cache is not None else ResultCache()
+    result = cache.get(key)
+    if result is None:
+        result = run_simulation(**scenario)
+        cache.put(key, result)
+    return result
+
+
+def cached_propability_of_state(*args, cache=None, **kwargs):
+    """compute_propability_of_state(*args, **kwargs) served from the cache."""
+    from propability_function import compute_propability_of_state
+
+    cache = cache if cache is not None else ResultCache()
+    key = cache_key('propability_of_state', {'args': args, 'kwargs': kwargs})
+    result = cache.get(key)
+    if result is None:
+        result = compute_propability_of_state(*args, **kwargs)
+        cache.put(key, result)
+    return result
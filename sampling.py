@@ -0,0 +1,93 @@
+import zlib
+
+import numpy as np
+
+BLOCK_SIZE = 4096  # variates generated by one vectorised call
+
+
+class VariatePool:
+    """Pre-sampled variates handed out one by one and refilled lazily in blocks.
+
+    draw_block(n) returns n variates from a single vectorised NumPy call. The block is kept as a
+    Python list, so next() costs one step of a list iterator instead of a call into NumPy for every scalar.
+    """
+    def __init__(self, draw_block, block_size=BLOCK_SIZE):
+        self._draw_block = draw_block
+        self.block_size = block_size
+        self._values = iter(())
+
+    def next(self):
+        try:
+            return next(self._values)
+        except StopIteration:
+            self._values = iter(self._draw_block(self.block_size).tolist())
+            return next(self._values)
+
+
+# Largest value of Generator.random(), reflecting u into LARGEST_UNIFORM - u maps its lattice onto itself
+LARGEST_UNIFORM = 1 - 2 ** -53
+
+
+def _uniforms(rng, n, antithetic):
+    """n uniforms from [0, 1), reflected for the antithetic member of a replication pair."""
+    uniforms = rng.random(n)
+    return LARGEST_UNIFORM - uniforms if antithetic else uniforms
+
+
+def exponential_pool(rng, rate, block_size=BLOCK_SIZE, antithetic=False):
+    """Exponential service times with the given rate (mu), by inversion so antithetic pools mirror plain ones."""
+    scale = 1 / rate
+    return VariatePool(lambda n: -scale * np.log1p(-_uniforms(rng, n, antithetic)), block_size)
+
+
+def cox_pool(rng, phases, rates, weights, block_size=BLOCK_SIZE, antithetic=False):
+    """Service times of the Cox mixture used by PS: phase drawn with weights, then exponential with its rate."""
+    cumulative = np.cumsum(weights, dtype=float)
+    cumulative /= cumulative[-1]
+    scales = 1 / np.asarray(rates, dtype=float)[np.asarray(phases)]
+    last_phase = len(scales) - 1
+
+    def draw_block(n):
+        uniforms = _uniforms(rng, 2 * n, antithetic)
+        chosen = np.minimum(np.searchsorted(cumulative, uniforms[:n], side='right'), last_phase)
+        return -np.log1p(-uniforms[n:]) * scales[chosen]
+
+    return VariatePool(draw_block, block_size)
+
+
+def uniform_pool(rng, block_size=BLOCK_SIZE, antithetic=False):
+    """Uniform numbers from [0, 1)."""
+    return VariatePool(lambda n: _uniforms(rng, n, antithetic), block_size)
+
+
+class RandomStreams:
+    """Independent random number streams of one run, one per purpose.
+
+    Every purpose gets its own generator derived from the seed and the purpose name, e.g.
+    'arrivals', 'arrival_class', 'service/<department>/<class>' or 'routing/<department>'. The
+    k-th service time of a class at a department therefore stays the same when another part of the
+    model changes, so two scenarios run with the same seed use common random numbers. With antithetic
+    set every pool draws the reflected uniforms of the plain run with the same seed.
+    """
+    def __init__(self, seed=None, antithetic=False):
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.antithetic = antithetic
+        self._generators = {}
+
+    def generator(self, purpose):
+        """Generator of a purpose, created on first use."""
+        rng = self._generators.get(purpose)
+        if rng is None:
+            seed_sequence = np.random.SeedSequence(self.seed_sequence.entropy,
+                                                   spawn_key=self.seed_sequence.spawn_key + (zlib.crc32(purpose.encode()),))
+            rng = self._generators[purpose] = np.random.default_rng(seed_sequence)
+        return rng
+
+    def exponential(self, purpose, rate):
+        return exponential_pool(self.generator(purpose), rate, antithetic=self.antithetic)
+
+    def cox(self, purpose, phases, rates, weights):
+        return cox_pool(self.generator(purpose), phases, rates, weights, antithetic=self.antithetic)
+
+    def uniform(self, purpose):
+        return uniform_pool(self.generator(purpose), antithetic=self.antithetic)
@@ -1,5 +1,10 @@
 import simpy as sp
 from network import *
+from simulation_log import SimulationLog
+from stopping import make_rule, SimulationCancelled
+from network_spec import build_network, three_department_spec
+from fast_engine import run_fast
+from arrivals import make_arrivals, feed_clients, time_limit
 
 # Adjustable parameters
 PS_PROCESSING_TIME = {
@@ -35,6 +40,7 @@ LIFOPR_PROCESSING_TIME = {
 PS_CONSULTANTS = 5
 FIFO_CONSULTANTS = 5
 LIFOPR_CONSULTANTS = 3
+LIFOPR_PREEMPTIVE = True # higher priority client interrupts a call in LIFOPR, interrupted one resumes later
 
 
 PS_PROPABILITIES = {
@@ -54,14 +60,78 @@ LIFOPR_PROPABILITIES = {
 NUM_CLIENTS = 20
 ARRIVAL_RATE = 2 # lambda aka arrival rate in system
 
+# How clients arrive: 'poisson' (exponential gaps with rate ARRIVAL_RATE), 'deterministic' (every 1 / ARRIVAL_RATE),
+# a rate schedule {'breakpoints': [0, 480, 720], 'rates': [1, 3, 2], 'period': 1440} (e.g. an intraday profile),
+# a trace {'times': [...], 'classes': [...] (optional)} or a process object from arrivals.
+ARRIVALS = 'poisson'
+
+# Log levels per category (see simulation_log), e.g. {'call': INFO, 'exit': INFO}, categories not given are not logged.
+# None switches logging off completely.
+LOG_LEVELS = None
+
+# When to stop: 'drain' (all clients left the network), 'until' (clients * 1000 time units, or 1000 times the time
+# the arrivals take when that is longer, see arrivals.time_limit), 'steady' or a rule object from stopping, e.g.
+# SteadyStateRule(kpis=('fifo_wait',), relative_half_width=0.02). The same time is the safety limit of 'drain'
+# (check DrainRule.drained) and of steady-state runs, which generate clients without limit.
+STOP_RULE = 'drain'
+
+# Simulated time between two calls of the progress callback of run_simulation
+PROGRESS_INTERVAL = 10
+
+# 'simpy' (processes on a SimPy environment) or 'fast' (event calendar of fast_engine, same model, about four times
+# faster on the default scenario, measure with python benchmark.py run)
+ENGINE = 'simpy'
+ENGINES = ('simpy', 'fast')
+
+# Parameters above as keyword arguments of run_simulation
+DEFAULT_SCENARIO = {
+    'ps_pt': PS_PROCESSING_TIME,
+    'fifo_pt': FIFO_PROCESSING_TIME,
+    'lifopr_pt': LIFOPR_PROCESSING_TIME,
+    'ps_co': PS_CONSULTANTS,
+    'fifo_co': FIFO_CONSULTANTS,
+    'lifopr_co': LIFOPR_CONSULTANTS,
+    'ps_prob': PS_PROPABILITIES,
+    'fifo_prob': FIFO_PROPABILITIES,
+    'lifopr_prob': LIFOPR_PROPABILITIES,
+    'clients': NUM_CLIENTS,
+    'arrival_rate': ARRIVAL_RATE,
+    'arrivals': ARRIVALS
+}
+
+def report_progress(env, context, progress, interval, departments):
+    """Call progress(now, exited clients, {department name: Results}) every interval time units.
+
+    A callback returning False cancels the run with SimulationCancelled.
+    """
+    results = {department.department_name: department.results for department in departments}
+    while True:
+        yield env.timeout(interval)
+        if progress(env.now, context.exited_clients, results) is False:
+            raise SimulationCancelled(f"cancelled at time {env.now:.2f}")
+
+
 # simulation
-def run_simulation(ps_pt, fifo_pt, lifopr_pt, ps_co, fifo_co, lifopr_co, ps_prob, fifo_prob, lifopr_prob, clients, arrival_rate):
-    env = sp.Environment()
+def run_simulation(ps_pt, fifo_pt, lifopr_pt, ps_co, fifo_co, lifopr_co, ps_prob, fifo_prob, lifopr_prob, clients, arrival_rate, lifopr_preemptive=LIFOPR_PREEMPTIVE,
+                   log_levels=LOG_LEVELS, log_sink=None, seed=None, record_on_change=False, env=None,
+                   stop=STOP_RULE, progress=None, progress_interval=PROGRESS_INTERVAL, engine=ENGINE, antithetic=False, arrivals=ARRIVALS):
+    if engine == 'fast':
+        spec = three_department_spec(ps_pt, fifo_pt, lifopr_pt, ps_co, fifo_co, lifopr_co, ps_prob, fifo_prob, lifopr_prob,
+                                     lifopr_preemptive)
+        stations, context, env = _run_fast(spec, clients, make_arrivals(arrivals, arrival_rate), log_levels, log_sink, seed,
+                                           record_on_change, env, stop, progress, progress_interval, antithetic)
+        ps_department, fifo_department, lifopr_department = stations
+        wait_times = (lifopr_department.statistics.wait.mean, fifo_department.statistics.wait.mean)
+        return fifo_department.results, lifopr_department.results, ps_department.results, wait_times, calculate_average_consultant_times(context.consultants)
+    _check_engine(engine)
+
+    env = env if env is not None else sp.Environment()
+    context = SimulationContext(env, SimulationLog(log_levels, log_sink), seed, record_on_change, antithetic)
 
     # creating departments
-    ps_department = DepartmentPS(env, 'ps') #covers only medium issues
-    fifo_department = DepartmentFIFO(env, 'fifo') #covers only normal issues and every other at start
-    lifopr_department = DepartmentLIFOPR(env, 'lifopr') #covers only complicated issues
+    ps_department = DepartmentPS(env, 'ps', context=context) #covers only medium issues
+    fifo_department = DepartmentFIFO(env, 'fifo', context=context) #covers only normal issues and every other at start
+    lifopr_department = DepartmentLIFOPR(env, 'lifopr', preemptive=lifopr_preemptive, context=context) #covers only complicated issues
 
     # filling mu in departments
     ps_department._fill_processing_time(ps_pt)
@@ -74,7 +144,7 @@ def run_simulation(ps_pt, fifo_pt, lifopr_pt, ps_co, fifo_co, lifopr_co, ps_prob
     lifopr_department._create_consultants(lifopr_co)
 
     # creating routes
-    route = Route(ps_department, fifo_department, lifopr_department)
+    route = Route(ps_department, fifo_department, lifopr_department, context=context)
 
     route._fill_propabilities(ps_prob, fifo_prob, lifopr_prob)
 
@@ -87,30 +157,74 @@ def run_simulation(ps_pt, fifo_pt, lifopr_pt, ps_co, fifo_co, lifopr_co, ps_prob
     env.process(lifopr_department._process_clients())
 
     # Adjust simulation setup
-    env.process(generate_clients(env, clients, arrival_rate, route, logging=True))
-    env.run(until=clients*1000)
-
-    return fifo_department.results, lifopr_department.results, ps_department.results, calculate_average_wait_times(all_clients), calculate_average_consultant_times(all_consultants)
-
-def calculate_average_wait_times(clients):
-    lifo_total = 0
-    fifo_total = 0
-    lifo_count = 0
-    fifo_count = 0
-
-    for client in clients:
-        for wait_time, department_type in client.wait_times:
-            if department_type == 'lifopr':
-                lifo_total += wait_time
-                lifo_count += 1
-            elif department_type == 'fifo':
-                fifo_total += wait_time
-                fifo_count += 1
-
-    lifo_mean = lifo_total / lifo_count if lifo_count > 0 else 0
-    fifo_mean = fifo_total / fifo_count if fifo_count > 0 else 0
-
-    return lifo_mean, fifo_mean
+    stop = make_rule(stop)
+    stop.prepare(context)
+    if progress is not None:
+        env.process(report_progress(env, context, progress, progress_interval,
+                                    (ps_department, fifo_department, lifopr_department)))
+    arrivals = make_arrivals(arrivals, arrival_rate)
+    env.process(feed_clients(env, arrivals, None if stop.unbounded_arrivals else clients, route))
+    stop.run(env, context, time_limit(arrivals, clients))
+    context.log.flush()
+
+    _complete_results(env, (ps_department, fifo_department, lifopr_department))
+
+    wait_times = (lifopr_department.statistics.wait.mean, fifo_department.statistics.wait.mean)
+    return fifo_department.results, lifopr_department.results, ps_department.results, wait_times, calculate_average_consultant_times(context.consultants)
+
+def _complete_results(env, departments):
+    """Keep streaming statistics and consultant load of every department next to the recorded series."""
+    for department in departments:
+        department.results.statistics = department.statistics
+        department.results.servers = len(department.consultants)
+        department.results.busy_time = sum(consultant.time_on_calls for consultant in department.consultants)
+        department.statistics.queue_length.update(env.now, department.statistics.queue_length.value)
+
+
+def run_network(spec, clients, arrival_rate, log_levels=LOG_LEVELS, log_sink=None, seed=None, record_on_change=False,
+                env=None, stop=STOP_RULE, progress=None, progress_interval=PROGRESS_INTERVAL, engine=ENGINE, antithetic=False,
+                arrivals=ARRIVALS):
+    """Simulate a generic network (see network_spec), returns {station name: Results}.
+
+    Arrivals, stopping, progress, the engine and antithetic runs work as in run_simulation.
+    """
+    if engine == 'fast':
+        stations, _, _ = _run_fast(spec, clients, make_arrivals(arrivals, arrival_rate), log_levels, log_sink, seed,
+                                   record_on_change, env, stop, progress, progress_interval, antithetic)
+        return {station.department_name: station.results for station in stations}
+    _check_engine(engine)
+
+    env = env if env is not None else sp.Environment()
+    context = SimulationContext(env, SimulationLog(log_levels, log_sink), seed, record_on_change, antithetic)
+    departments, route = build_network(env, spec, context)
+
+    stop = make_rule(stop)
+    stop.prepare(context)
+    if progress is not None:
+        env.process(report_progress(env, context, progress, progress_interval, departments))
+    arrivals = make_arrivals(arrivals, arrival_rate)
+    env.process(feed_clients(env, arrivals, None if stop.unbounded_arrivals else clients, route))
+    stop.run(env, context, time_limit(arrivals, clients))
+    context.log.flush()
+
+    _complete_results(env, departments)
+    return {department.department_name: department.results for department in departments}
+
+
+def _check_engine(engine):
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, use one of {ENGINES}")
+
+
+def _run_fast(spec, clients, arrivals, log_levels, log_sink, seed, record_on_change, env, stop, progress, progress_interval,
+              antithetic):
+    """Run a network spec on the event calendar of fast_engine, returns its completed (stations, context, env)."""
+    if env is not None:
+        raise ValueError("the fast engine has its own event calendar, env only works with engine='simpy'")
+    stations, context, env = run_fast(spec, clients, arrivals, make_rule(stop), log_levels, log_sink, seed,
+                                      record_on_change, progress, progress_interval, antithetic)
+    _complete_results(env, stations)
+    return stations, context, env
 
 
 def calculate_average_consultant_times(consultants):
@@ -0,0 +1,48 @@
+import sys
+
+# Levels use the same values as the standard logging module
+DEBUG = 10
+INFO = 20
+WARNING = 30
+OFF = 100
+
+# Categories of simulation events
+ARRIVAL = 'arrival'   # client enters the network
+CALL = 'call'         # consultant starts a call in FIFO / LIFOPR
+BREAK = 'break'       # consultant takes a break after a call
+PS = 'ps'             # client leaves Processor Sharing
+EXIT = 'exit'         # client leaves the network
+
+
+class SimulationLog:
+    """Event log of a single simulation run with a level for each category.
+
+    Categories not listed in levels are switched off. Objects taking part in the simulation ask
+    enabled() once when they are created and keep the answer as a flag, so a switched off category
+    costs one attribute check per event and no message is ever formatted. Enabled messages are kept
+    together with their arguments and formatted in batches when the buffer is flushed to the sink.
+    """
+    def __init__(self, levels=None, sink=None, buffer_size=1000):
+        self.levels = dict(levels or {})  # {'category': minimal level written}
+        self.sink = sink if sink is not None else sys.stdout
+        self.buffer_size = buffer_size
+        self._buffer = []
+
+    def enabled(self, category, level=INFO):
+        """Check whether messages of the category with the given level are written."""
+        return level >= self.levels.get(category, OFF)
+
+    def write(self, message, *args):
+        """Store a %-style message, it is formatted when the buffer gets flushed."""
+        self._buffer.append((message, args))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Format buffered messages and write them to the sink in one go."""
+        if not self._buffer:
+            return
+        self.sink.write("".join((message % args) + "\n" for message, args in self._buffer))
+        self._buffer.clear()
+        if hasattr(self.sink, 'flush'):
+            self.sink.flush()
@@ -0,0 +1,129 @@
+"""Run a simulation in a separate process and stream its progress back.
+
+The GUI starts a SimulationWorker with the keyword arguments of run_simulation and polls it from
+Tk's after() loop, so the window keeps responding during long runs. The worker is a plain
+interpreter running this file: it reads the scenario from stdin and writes pickled messages to
+stdout, which keeps the GUI module from being imported again in the child process.
+
+Messages returned by SimulationWorker.poll():
+    ('progress', time, exited clients, {department: new points}), where new points holds the
+        queue_change_time, queue_size, processed_clients_time and processed_clients samples
+        recorded since the previous progress message
+    ('done', result of run_simulation)
+    ('error', message)
+"""
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+# Minimal wall-clock time between two progress messages in seconds
+REPORT_INTERVAL = 0.1
+
+SERIES = ('queue_change_time', 'queue_size', 'processed_clients_time', 'processed_clients')
+
+
+class SimulationWorker:
+    """Simulation running in a child process, messages are collected by a reader thread."""
+    def __init__(self):
+        self.process = None
+        self.messages = queue.Queue()
+        self.cancelled = False
+
+    def start(self, scenario, cache_directory=None):
+        """Start run_simulation(**scenario) in a new process.
+
+        With cache_directory the result is stored in the ResultCache there (when the run is reproducible).
+        """
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        cwd=os.path.dirname(os.path.abspath(__file__)))
+        pickle.dump((scenario, cache_directory), self.process.stdin)
+        self.process.stdin.close()
+        threading.Thread(target=self._read_messages, args=(self.process.stdout,), daemon=True).start()
+
+    def _read_messages(self, stream):
+        try:
+            while True:
+                self.messages.put(pickle.load(stream))
+        except EOFError:
+            pass
+        except Exception as e:
+            self.messages.put(('error', f"worker output unreadable: {e}"))
+        finally:
+            stream.close()
+            if self.process.wait() != 0 and not self.cancelled:
+                self.messages.put(('error', f"worker exited with code {self.process.returncode}"))
+            self.messages.put(None)  # end of the run
+
+    def poll(self):
+        """All messages received since the last call, None marks the end of the run."""
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def cancel(self):
+        """Stop the run, its results are discarded."""
+        if self.running:
+            self.cancelled = True
+            self.process.terminate()
+
+
+def _progress_reporter(channel):
+    """Progress callback of run_simulation sending new samples at most every REPORT_INTERVAL seconds."""
+    sent = {}  # {department: {series: number of samples already sent}}
+    last_report = 0
+
+    def report(now, exited_clients, results):
+        nonlocal last_report
+        if time.perf_counter() - last_report < REPORT_INTERVAL:
+            return
+        last_report = time.perf_counter()
+        points = {}
+        for name, department in results.items():
+            offsets = sent.setdefault(name, dict.fromkeys(SERIES, 0))
+            points[name] = {}
+            for series in SERIES:
+                values = getattr(department, series).view()
+                points[name][series] = values[offsets[series]:].copy()
+                offsets[series] = len(values)
+        pickle.dump(('progress', now, exited_clients, points), channel)
+        channel.flush()
+
+    return report
+
+
+def main():
+    # Pickled messages get their own copy of stdout, anything printed (e.g. the log) goes to stderr
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    from simulation import run_simulation
+    from result_cache import ResultCache, simulation_key
+
+    scenario, cache_directory = pickle.load(sys.stdin.buffer)
+    try:
+        result = run_simulation(**scenario, progress=_progress_reporter(channel))
+    except Exception as e:
+        pickle.dump(('error', str(e)), channel)
+    else:
+        pickle.dump(('done', result), channel)
+        key = simulation_key(scenario)
+        if cache_directory is not None and key is not None:
+            ResultCache(cache_directory).put(key, result)
+    channel.close()
+
+
+if __name__ == '__main__':
+    main()
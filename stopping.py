@@ -0,0 +1,98 @@
+from estimation import BatchedSeries, mser_truncation, batch_means
+
+
+class SimulationCancelled(Exception):
+    """Raised out of run_simulation when the progress callback asks to stop the run."""
+
+
+class UntilRule:
+    """Run for a fixed simulated time, the original behaviour."""
+    unbounded_arrivals = False
+
+    def prepare(self, context):
+        pass
+
+    def run(self, env, context, max_time):
+        env.run(until=max_time)
+        self.stopped_at = env.now
+
+
+class DrainRule:
+    """Stop as soon as every generated client has left the network (max_time is only a safety limit).
+
+    After the run drained tells whether every client left, False when the safety limit stopped it.
+    """
+    unbounded_arrivals = False
+
+    def prepare(self, context):
+        pass
+
+    def run(self, env, context, max_time):
+        env.run(until=env.any_of([context.all_exited, env.timeout(max(max_time - env.now, 0))]))
+        self.stopped_at = env.now
+        self.drained = context.all_exited.triggered
+
+
+class SteadyStateRule:
+    """Run until the steady-state means of the chosen KPIs are known precisely enough.
+
+    Clients keep arriving without limit. Every KPI is kept as at most stored_batches batch means (see
+    estimation.BatchedSeries), so memory and the work of a check do not grow with the run. Every
+    check_interval time units the series is truncated with MSER-5 to delete the warm-up period and the
+    rest is split into batches; the run
+    stops when every KPI has at least min_observations kept observations and a batch-means confidence
+    half-width of at most relative_half_width * |mean|, or when max_time is reached.
+
+    KPIs: 'fifo_wait' and 'lifopr_wait' (wait for a consultant), 'ps_time' (time spent in PS) and
+    'sojourn' (time from arrival to leaving the network). After the run estimates holds
+    {kpi: {'mean', 'half_width', 'warmup', 'observations'}} and converged tells whether the target was met.
+    """
+    unbounded_arrivals = True
+
+    def __init__(self, kpis=('sojourn',), relative_half_width=0.05, confidence=0.95, batches=20,
+                 check_interval=1000, min_observations=200, stored_batches=4096):
+        self.kpis = tuple(kpis)
+        self.relative_half_width = relative_half_width
+        self.confidence = confidence
+        self.batches = batches
+        self.check_interval = check_interval
+        self.min_observations = min_observations
+        self.stored_batches = stored_batches
+        self.estimates = {}
+        self.converged = False
+
+    def prepare(self, context):
+        context.kpi_observations = {kpi: BatchedSeries(self.stored_batches) for kpi in self.kpis}
+
+    def _estimate(self, series):
+        # MSER-5 averages 5 observations, stored means already average batch_size of them
+        warmup = mser_truncation(series.means, max(round(5 / series.batch_size), 1))
+        kept = series.means[warmup:]
+        mean, half_width = batch_means(kept, self.batches, self.confidence)
+        return {'mean': mean, 'half_width': half_width, 'warmup': warmup * series.batch_size,
+                'observations': len(kept) * series.batch_size}
+
+    def _precise(self, estimate):
+        return (estimate['observations'] >= self.min_observations
+                and estimate['half_width'] <= self.relative_half_width * abs(estimate['mean']))
+
+    def run(self, env, context, max_time):
+        while env.now < max_time:
+            env.run(until=min(env.now + self.check_interval, max_time))
+            self.estimates = {kpi: self._estimate(context.kpi_observations[kpi]) for kpi in self.kpis}
+            self.converged = all(self._precise(estimate) for estimate in self.estimates.values())
+            if self.converged:
+                break
+        self.stopped_at = env.now
+
+
+RULES = {
+    'until': UntilRule,
+    'drain': DrainRule,
+    'steady': SteadyStateRule
+}
+
+
+def make_rule(stop):
+    """Rule instance for a name from RULES, rule objects are returned unchanged."""
+    return RULES[stop]() if isinstance(stop, str) else stop
@@ -0,0 +1,235 @@
+"""Streaming statistics of a run, memory does not depend on the number of clients.
+
+Observations are buffered and folded in batches of BATCH_SIZE with NumPy, so adding one costs a
+list append; reading a statistic folds the pending observations first.
+"""
+import math
+
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.95)
+BATCH_SIZE = 1024
+
+
+class QuantileSketch:
+    """Quantiles of non-negative observations from a histogram with logarithmic buckets (DDSketch).
+
+    Bucket k holds the observations in (gamma^(k-1), gamma^k] with gamma = (1 + alpha) / (1 - alpha) and
+    reports them as 2 gamma^k / (gamma + 1), so every quantile is within a relative error alpha of the
+    sample quantile. Observations up to min_value count as zero. Memory grows with log(max / min), not
+    with the number of observations.
+    """
+    def __init__(self, alpha=0.01, min_value=1e-9):
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.count = 0
+        self.zeros = 0
+        self.offset = 0  # key of counts[0]
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=float)
+        positive = values[values > self.min_value]
+        self.count += len(values)
+        self.zeros += len(values) - len(positive)
+        if not len(positive):
+            return
+        keys = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        low, high = int(keys.min()), int(keys.max())
+        if not len(self.counts):
+            self.offset, self.counts = low, np.zeros(high - low + 1, dtype=np.int64)
+        elif low < self.offset or high >= self.offset + len(self.counts):
+            offset = min(low, self.offset)
+            counts = np.zeros(max(high, self.offset + len(self.counts) - 1) - offset + 1, dtype=np.int64)
+            counts[self.offset - offset:self.offset - offset + len(self.counts)] = self.counts
+            self.offset, self.counts = offset, counts
+        self.counts += np.bincount(keys - self.offset, minlength=len(self.counts))
+
+    def quantile(self, p):
+        if not self.count:
+            return float('nan')
+        rank = p * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), rank - self.zeros, side='right'))
+        return 2 * self.gamma ** (self.offset + index) / (self.gamma + 1)
+
+
+class SummaryStatistics:
+    """Count, mean and variance, extremes and quantiles of a stream of non-negative observations.
+
+    Batches are merged into the running moments with the pairwise update of Chan, Golub & LeVeque,
+    quantiles come from a QuantileSketch and are clipped to the observed extremes. quantiles lists the
+    ones reported by as_dict, an empty tuple skips the sketch.
+    """
+    def __init__(self, quantiles=QUANTILES):
+        self._count = 0
+        self._mean = 0.0
+        self._squares = 0.0
+        self._minimum = math.inf
+        self._maximum = -math.inf
+        self._pending = []
+        self.quantiles = tuple(quantiles)
+        self.sketch = QuantileSketch() if self.quantiles else None
+
+    def add(self, value):
+        pending = self._pending
+        pending.append(value)
+        if len(pending) == BATCH_SIZE:
+            self._fold()
+
+    def add_many(self, values):
+        self._pending.extend(values)
+        self._fold()
+
+    def _fold(self):
+        if not self._pending:
+            return
+        values = np.asarray(self._pending, dtype=float)
+        self._pending = []
+        n = len(values)
+        mean = values.mean()
+        total = self._count + n
+        delta = mean - self._mean
+        self._squares += ((values - mean) ** 2).sum() + delta * delta * self._count * n / total
+        self._mean += delta * n / total
+        self._count = total
+        self._minimum = min(self._minimum, values.min())
+        self._maximum = max(self._maximum, values.max())
+        if self.sketch is not None:
+            self.sketch.add_many(values)
+
+    @property
+    def count(self):
+        return self._count + len(self._pending)
+
+    @property
+    def mean(self):
+        self._fold()
+        return float(self._mean)
+
+    @property
+    def minimum(self):
+        self._fold()
+        return float(self._minimum)
+
+    @property
+    def maximum(self):
+        self._fold()
+        return float(self._maximum)
+
+    @property
+    def variance(self):
+        self._fold()
+        return float(self._squares / (self._count - 1)) if self._count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def quantile(self, p):
+        self._fold()
+        if self.sketch is None:
+            raise ValueError("quantiles are not tracked")
+        value = self.sketch.quantile(p)
+        return min(max(value, self._minimum), self._maximum) if self._count else value
+
+    def as_dict(self):
+        summary = {'count': self.count, 'mean': self.mean, 'std': self.std,
+                   'min': self.minimum if self.count else float('nan'),
+                   'max': self.maximum if self.count else float('nan')}
+        for p in self.quantiles:
+            summary[f'p{round(p * 100)}'] = self.quantile(p)
+        return summary
+
+
+class TimeWeightedStatistics:
+    """Time-weighted mean and variance of a step function such as a queue length."""
+    def __init__(self, start_time=0.0, value=0.0):
+        self.start_time = start_time
+        self.last_time = start_time
+        self.value = value
+        self.maximum = value
+        self._area = 0.0
+        self._area_squares = 0.0
+
+    def update(self, time, value):
+        elapsed = time - self.last_time
+        self._area += self.value * elapsed
+        self._area_squares += self.value * self.value * elapsed
+        self.last_time = time
+        self.value = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def update_many(self, times, values):
+        """update for every (time, value) pair in order, vectorised."""
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values)
+        if not len(times):
+            return
+        steps = np.concatenate(([self.value], values[:-1])).astype(float)
+        elapsed = np.diff(times, prepend=self.last_time)
+        self._area += float(steps @ elapsed)
+        self._area_squares += float((steps * steps) @ elapsed)
+        self.last_time = float(times[-1])
+        self.value = values[-1].item()
+        self.maximum = max(self.maximum, values.max().item())
+
+    def _integrals(self, until):
+        until = self.last_time if until is None else max(until, self.last_time)
+        tail = until - self.last_time
+        return self._area + self.value * tail, self._area_squares + self.value * self.value * tail, until - self.start_time
+
+    def mean(self, until=None):
+        area, _, duration = self._integrals(until)
+        return area / duration if duration > 0 else 0.0
+
+    def variance(self, until=None):
+        area, area_squares, duration = self._integrals(until)
+        if duration <= 0:
+            return 0.0
+        mean = area / duration
+        return max(area_squares / duration - mean * mean, 0.0)
+
+    def as_dict(self, until=None):
+        return {'mean': self.mean(until), 'variance': self.variance(until), 'max': self.maximum}
+
+
+class DepartmentStatistics:
+    """Streaming statistics of one department.
+
+    wait: time waiting for a consultant (FIFO / LIFOPR), time_in_department: from entering the
+    department until leaving it, queue_length: time-weighted queue size, sojourn: time in the network
+    of clients who left the network from this department.
+    """
+    def __init__(self, quantiles=QUANTILES):
+        self.wait = SummaryStatistics(quantiles)
+        self.time_in_department = SummaryStatistics(quantiles)
+        self.queue_length = TimeWeightedStatistics()
+        self.sojourn = SummaryStatistics(quantiles)
+
+    def as_dict(self, until=None):
+        return {
+            'wait': self.wait.as_dict(),
+            'time_in_department': self.time_in_department.as_dict(),
+            'queue_length': self.queue_length.as_dict(until),
+            'sojourn': self.sojourn.as_dict()
+        }
+
+
+class RunStatistics:
+    """Streaming statistics of a whole run, memory does not depend on the number of clients."""
+    def __init__(self, quantiles=QUANTILES):
+        self.quantiles = quantiles
+        self.departments = {}
+
+    def department(self, name):
+        statistics = self.departments.get(name)
+        if statistics is None:
+            statistics = self.departments[name] = DepartmentStatistics(self.quantiles)
+        return statistics
+
+    def as_dict(self, until=None):
+        return {name: statistics.as_dict(until) for name, statistics in self.departments.items()}
@@ -0,0 +1,88 @@
+import numpy as np
+
+from chart import CHART_SERIES, series_key, simulation_chart
+
+
+class StubLine:
+    def __init__(self, **style):
+        self.style = style
+        self.data = ([], [])
+
+    def set_data(self, x, y):
+        self.data = (x, y)
+
+
+class StubCallbacks:
+    def connect(self, event, callback):
+        pass
+
+
+class StubBbox:
+    width = 100
+
+
+class StubAxes:
+    def __init__(self):
+        self.callbacks = StubCallbacks()
+        self.bbox = StubBbox()
+        self.xlim = (0, 1)
+        self.ylim = (0, 1)
+        self.lines = []
+
+    def plot(self, x, y, **style):
+        line = StubLine(**style)
+        self.lines.append(line)
+        return [line]
+
+    def get_xlim(self):
+        return self.xlim
+
+    def get_ylim(self):
+        return self.ylim
+
+    def set_xlim(self, low, high):
+        self.xlim = (low, high)
+
+    def set_ylim(self, low, high):
+        self.ylim = (low, high)
+
+    def draw_artist(self, artist):
+        pass
+
+
+class StubCanvas:
+    def __init__(self):
+        self.draws = 0
+
+    def mpl_connect(self, event, callback):
+        pass
+
+    def draw_idle(self):
+        self.draws += 1
+
+    def copy_from_bbox(self, bbox):
+        return object()
+
+    def restore_region(self, region):
+        pass
+
+    def blit(self, bbox):
+        pass
+
+
+def test_simulation_chart_extend_and_set_data():
+    ax, canvas = StubAxes(), StubCanvas()
+    chart = simulation_chart(ax, canvas)
+    assert len(ax.lines) == len(CHART_SERIES)
+    assert ax.lines[0].style['label'] == "FIFO Queue Size"
+
+    for series in CHART_SERIES:
+        chart.extend(series_key(series), [0.0, 1.0, 2.0], [0, 1, 2])
+    chart.refresh()
+    assert ax.get_xlim()[1] >= 2.0
+
+    for series in CHART_SERIES:
+        chart.set_data(series_key(series), np.arange(10.0), np.arange(10))
+    chart.refresh()
+    chart.refresh()
+    assert all(len(line.data[0]) == 10 for line in ax.lines)
@@ -0,0 +1,22 @@
+import pytest
+
+from estimation import t_quantile, confidence_interval
+
+# two-sided quantiles from the standard t table
+T_TABLE = [
+    (0.90, 1, 6.314), (0.90, 5, 2.015), (0.90, 30, 1.697),
+    (0.95, 1, 12.706), (0.95, 2, 4.303), (0.95, 3, 3.182), (0.95, 4, 2.776), (0.95, 5, 2.571),
+    (0.95, 10, 2.228), (0.95, 30, 2.042), (0.95, 60, 2.000), (0.95, 120, 1.980),
+    (0.99, 1, 63.657), (0.99, 10, 3.169), (0.99, 30, 2.750), (0.99, 60, 2.660),
+]
+
+
+@pytest.mark.parametrize('confidence, dof, quantile', T_TABLE)
+def test_t_quantile_matches_table(confidence, dof, quantile):
+    assert t_quantile(confidence, dof) == pytest.approx(quantile, abs=5e-4)
+
+
+def test_confidence_interval_of_two_values():
+    mean, std, half_width = confidence_interval([1.0, 3.0])
+    assert mean == 2.0
+    assert half_width == pytest.approx(12.706 * std / 2 ** 0.5, rel=1e-4)
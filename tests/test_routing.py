@@ -0,0 +1,17 @@
+import pytest
+
+from network import compile_routing_table
+
+
+def test_routing_table_is_cumulative():
+    outcomes = {'normal': ['exit', 'fifo'], 'medium': ['exit'], 'complicated': None}
+    table = compile_routing_table(outcomes, {'normal': [0.25, 0.75]})
+    assert table[0] == ((0.25, 1.0), ('exit', 'fifo'))
+    assert table[1] == ((1.0,), ('exit',))
+    assert table[2] is None
+
+
+def test_routing_weights_must_match_outcomes():
+    outcomes = {'normal': ['exit'], 'medium': ['exit', 'fifo', 'quit_system'], 'complicated': None}
+    with pytest.raises(ValueError):
+        compile_routing_table(outcomes, {'medium': [0.3, 0.7]})
@@ -0,0 +1,149 @@
+"""Variance reduction for replicated experiments: common random numbers, antithetic pairs, control variates.
+
+Every run draws from per-purpose random streams (sampling.RandomStreams), which makes three techniques
+possible on top of replication.py:
+
+- compare_scenarios runs two scenarios with the same seeds (common random numbers), the k-th client
+  gets the same issue type and the same service times in both, and summarises the paired differences;
+- run_antithetic runs every seed twice, with plain and with mirrored uniforms, and uses the average
+  of a pair as one observation;
+- control_variates corrects replication means with metrics whose expectation is known exactly: the
+  numbers of processed clients of every department and the call time of FIFO and LIFOPR consultants.
+  In a drained run they follow from the visit ratios solved by solve_product_form and the mean service
+  times, whatever the queueing disciplines, so the correction adds no bias.
+"""
+import numpy as np
+
+from arrivals import make_arrivals
+from estimation import t_quantile
+from network import ISSUE_TYPES, PS_OUTCOMES, FIFO_OUTCOMES, LIFOPR_OUTCOMES
+from propability_function import solve_product_form
+from replication import run_tasks, summarize_replications, DEPARTMENTS
+from simulation import DEFAULT_SCENARIO, STOP_RULE, ARRIVALS
+
+CONTROLS = tuple(f'{department}_processed' for department in DEPARTMENTS) + ('fifo_avg_call_time', 'lifopr_avg_call_time')
+
+
+def _numeric(runs):
+    """Metrics of the runs as {metric: array}, metrics with missing values are left out."""
+    metrics = {}
+    for metric in runs[0]:
+        values = [run[metric] for run in runs]
+        if all(value is not None for value in values):
+            metrics[metric] = np.asarray(values, dtype=float)
+    return metrics
+
+
+def compare_scenarios(scenario_a, scenario_b, replications=10, seed=None, processes=None, confidence=0.95):
+    """Difference b - a of every metric estimated with common random numbers.
+
+    Both scenarios only need the keyword arguments that differ from DEFAULT_SCENARIO. Replication k of
+    both scenarios uses the k-th child of SeedSequence(seed). Returns the summary of the paired
+    differences ({metric: {'mean', 'std', 'half_width', 'ci', 'n'}}) and the runs of both scenarios.
+    """
+    scenario_a, scenario_b = dict(DEFAULT_SCENARIO, **scenario_a), dict(DEFAULT_SCENARIO, **scenario_b)
+    seeds = np.random.SeedSequence(seed).spawn(replications)
+    runs = run_tasks([(scenario, child) for scenario in (scenario_a, scenario_b) for child in seeds], processes)
+    runs_a, runs_b = runs[:replications], runs[replications:]
+    values_a, values_b = _numeric(runs_a), _numeric(runs_b)
+    differences = [{metric: values_b[metric][k] - values_a[metric][k] for metric in values_a if metric in values_b}
+                   for k in range(replications)]
+    return summarize_replications(differences, confidence), runs_a, runs_b
+
+
+def run_antithetic(scenario=None, pairs=5, seed=None, processes=None, confidence=0.95):
+    """Replications in antithetic pairs, the confidence interval is built from the pair averages.
+
+    scenario only needs the keyword arguments that differ from DEFAULT_SCENARIO. Returns the summary
+    over pairs and the runs as (plain, antithetic) tuples.
+    """
+    scenario = dict(DEFAULT_SCENARIO, **(scenario or {}))
+    seeds = np.random.SeedSequence(seed).spawn(pairs)
+    runs = run_tasks([(dict(scenario, antithetic=antithetic), child) for child in seeds for antithetic in (False, True)],
+                     processes)
+    pair_runs = list(zip(runs[::2], runs[1::2]))
+    values = [_numeric(pair) for pair in pair_runs]
+    averages = [{metric: pair_values.mean() for metric, pair_values in pair.items()} for pair in values]
+    return summarize_replications(averages, confidence), pair_runs
+
+
+def _routing_probabilities(probabilities, issue_type, outcomes):
+    """Normalised probabilities of the outcomes, equally likely when not given (as in compile_routing_table)."""
+    weights = np.asarray(probabilities.get(issue_type) or [1] * len(outcomes), dtype=float)
+    return weights / weights.sum()
+
+
+def expected_controls(scenario):
+    """Expectations of the CONTROLS in a drained run of the scenario, {control: value}.
+
+    Visit ratios of the product-form model are the expected visits of a client of every starting issue
+    type, new clients get one of the three types with equal probability. FIFO only serves medium and
+    LIFOPR only complicated issues, so a consultant there spends visits / (rate * consultants) on calls;
+    interrupted calls are resumed and add up to the full service time.
+    """
+    servers = (scenario['ps_co'], scenario['fifo_co'], scenario['lifopr_co'])
+    solution = solve_product_form(
+        *(_routing_probabilities(scenario['ps_prob'], issue_type, PS_OUTCOMES[issue_type]) for issue_type in ISSUE_TYPES),
+        _routing_probabilities(scenario['fifo_prob'], 'medium', FIFO_OUTCOMES),
+        _routing_probabilities(scenario['lifopr_prob'], 'complicated', LIFOPR_OUTCOMES),
+        [scenario['fifo_pt']['medium'], scenario['lifopr_pt']['complicated']], [scenario['arrival_rate']],
+        scenario['ps_pt'], servers)
+    e_11, e_12, e_13, e_22, e_33 = solution.visit_ratios
+    ps_visits, fifo_visits, lifopr_visits = (scenario['clients'] * visit / len(ISSUE_TYPES) for visit in (e_11 + e_12 + e_13, e_22, e_33))
+    return dict(zip(CONTROLS, (ps_visits, fifo_visits, lifopr_visits,
+                               fifo_visits / scenario['fifo_pt']['medium'] / scenario['fifo_co'],
+                               lifopr_visits / scenario['lifopr_pt']['complicated'] / scenario['lifopr_co'])))
+
+
+def control_variates(runs, expectations, confidence=0.95):
+    """Controlled means of every metric that is not a control.
+
+    expectations maps control metrics to their known means. The coefficients are fitted by least squares
+    over the replications, the half-width uses n - q - 1 degrees of freedom for q controls. Returns
+    {metric: {'mean', 'std', 'half_width', 'ci', 'n', 'beta', 'variance_ratio'}}, where variance_ratio is
+    the variance of the controlled estimator relative to the plain replication mean.
+    """
+    values = _numeric(runs)
+    controls = [control for control in expectations if control in values and np.ptp(values[control]) > 0]
+    n, q = len(runs), len(controls)
+    if n <= q + 1:
+        raise ValueError(f"{q} control variates need more than {q + 1} replications")
+    deviations = np.column_stack([values[control] - expectations[control] for control in controls])
+    centred = deviations - deviations.mean(axis=0)
+    design = np.column_stack([np.ones(n), centred])
+
+    summary = {}
+    for metric, observations in values.items():
+        if metric in expectations:
+            continue
+        coefficients, *_ = np.linalg.lstsq(design, observations, rcond=None)
+        beta = coefficients[1:]
+        mean = observations.mean() - deviations.mean(axis=0) @ beta
+        residuals = observations - design @ coefficients
+        residual_variance = residuals @ residuals / (n - q - 1)
+        offset = deviations.mean(axis=0)
+        estimator_variance = residual_variance * (1 / n + offset @ np.linalg.pinv(centred.T @ centred) @ offset)
+        half_width = t_quantile(confidence, n - q - 1) * np.sqrt(estimator_variance)
+        plain_variance = observations.var(ddof=1) / n
+        summary[metric] = {
+            'mean': mean,
+            'std': np.sqrt(residual_variance),
+            'half_width': half_width,
+            'ci': (mean - half_width, mean + half_width),
+            'n': n,
+            'beta': dict(zip(controls, beta)),
+            'variance_ratio': estimator_variance / plain_variance if plain_variance > 0 else float('nan')
+        }
+    return summary
+
+
+def run_controlled(scenario=None, replications=10, seed=None, processes=None, confidence=0.95):
+    """Replications of a drained scenario with control-variate estimates, returns (summary, runs)."""
+    scenario = dict(DEFAULT_SCENARIO, **(scenario or {}))
+    if scenario.get('stop', STOP_RULE) != 'drain':
+        raise ValueError("control variates need runs with stop='drain', only then every client is counted")
+    if make_arrivals(scenario.get('arrivals', ARRIVALS), scenario['arrival_rate']).limit is not None:
+        raise ValueError("control variates need generated arrivals, a trace fixes the clients and their issue types")
+    seeds = np.random.SeedSequence(seed).spawn(replications)
+    runs = run_tasks([(scenario, child) for child in seeds], processes)
+    return control_variates(runs, expected_controls(scenario), confidence), runs